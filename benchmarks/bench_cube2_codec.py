@@ -0,0 +1,53 @@
+# Compares the table-driven cube2 codec against the original implementation, which looked up every character with
+# list.index(), by encoding an update response for 10k servers.
+#
+# Run with: python benchmarks/bench_cube2_codec.py
+
+import timeit
+
+from masterserver._codec import Cube2Codec, register_codec
+from masterserver.red_eclipse_server import RedEclipseServer
+
+
+SERVERS_COUNT = 10000
+
+
+def legacy_encode(string: str) -> bytes:
+    return b"".join([bytes([Cube2Codec.CUBE2UNICHARS.index(ord(char))]) for char in string])
+
+
+def build_update_response() -> str:
+    lines = [
+        "setversion 160 230",
+        "clearservers",
+    ]
+
+    for i in range(SERVERS_COUNT):
+        server = RedEclipseServer(
+            "10.%d.%d.%d" % (i >> 16 & 0xff, i >> 8 & 0xff, i & 0xff), 28801,
+            10, "Einherjer Europe [linuxiuvat.de] äöü #%d" % i, "", "", "stable"
+        )
+        lines.append("addserver %s" % server.addserver_line())
+
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    register_codec()
+
+    response = build_update_response()
+    assert legacy_encode(response) == response.encode("cube2")
+
+    number = 5
+
+    legacy = min(timeit.repeat(lambda: legacy_encode(response), number=number, repeat=3)) / number
+    table = min(timeit.repeat(lambda: response.encode("cube2"), number=number, repeat=3)) / number
+
+    print("update response: %d servers, %d characters" % (SERVERS_COUNT, len(response)))
+    print("legacy encode: %8.3f ms" % (legacy * 1000))
+    print("table encode:  %8.3f ms" % (table * 1000))
+    print("speedup:       %8.1fx" % (legacy / table))
+
+
+if __name__ == "__main__":
+    main()
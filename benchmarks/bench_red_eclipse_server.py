@@ -0,0 +1,89 @@
+# Compares memory usage and throughput of RedEclipseServer with the original implementation, which stored its
+# attributes in a __dict__, an IPv4Address object as address and rendered everything on demand, at 100k entries.
+#
+# Run with: python benchmarks/bench_red_eclipse_server.py
+
+import gc
+import time
+import tracemalloc
+from ipaddress import IPv4Address
+
+from masterserver.red_eclipse_server import RedEclipseServer
+
+
+ENTRIES_COUNT = 100000
+
+
+class LegacyRedEclipseServer:
+    def __init__(self, ip_addr: str, port: int,
+                 priority: int = 0, description: str = None, handle: str = None, role: str = None, branch: str = None,
+                 remote_master_server=None):
+        self._ip_addr = IPv4Address(ip_addr)
+        self._port = int(port)
+        self._priority = int(priority)
+        self._description = description
+        self._auth_handle = handle
+        self._role = role
+        self._branch = branch
+        self._remote_master_server = remote_master_server
+
+    @property
+    def ip_addr(self):
+        return IPv4Address(self._ip_addr)
+
+    def addserver_line(self):
+        return '%s %d %d "%s" "%s" "%s" "%s"' % (
+            self.ip_addr, self._port, self._priority, self._description, self._auth_handle, self._role, self._branch
+        )
+
+    def __eq__(self, other):
+        return self.ip_addr == other.ip_addr and self._port == other._port
+
+    def __hash__(self):
+        return hash((self.ip_addr, self._port))
+
+
+def make_args():
+    return [
+        ("10.%d.%d.%d" % (i >> 16 & 0xff, i >> 8 & 0xff, i & 0xff), 28801, 10, "server #%d" % i, "", "", "stable")
+        for i in range(ENTRIES_COUNT)
+    ]
+
+
+def measure(cls, args):
+    gc.collect()
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    servers = [cls(*i) for i in args]
+    construction = time.perf_counter() - started
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    servers_set = set(servers)
+    assert all(server in servers_set for server in servers)
+    set_operations = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for i in range(3):
+        for server in servers:
+            server.addserver_line()
+    rendering = time.perf_counter() - started
+
+    print("%s:" % cls.__name__)
+    print("  memory:                   %8.1f MiB (%d bytes per entry)" % (memory / 2 ** 20, memory / len(servers)))
+    print("  construction:             %8.1f ms" % (construction * 1000))
+    print("  set insert and lookup:    %8.1f ms" % (set_operations * 1000))
+    print("  render list three times:  %8.1f ms" % (rendering * 1000))
+
+
+def main():
+    args = make_args()
+
+    measure(LegacyRedEclipseServer, args)
+    measure(RedEclipseServer, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# Compares the addserver line parser with the original regular expression based implementation, which decoded every
+# field on its own, on a dump of 50k lines as sent by an upstream master server.
+#
+# Run with: python benchmarks/bench_server_list_parser.py
+
+import re
+import time
+
+from masterserver.red_eclipse_server import RedEclipseServer
+from masterserver.server_list_parser import ServerListParser
+
+
+LINES_COUNT = 50000
+ROUNDS = 5
+
+
+class LegacyServerListParser:
+    def __init__(self, remote_master_server):
+        self._remote_master_server = remote_master_server
+
+    def parse_line(self, line: bytes):
+        line.rstrip(b"\n")
+
+        if not line.startswith(b"addserver"):
+            return None
+
+        match = re.match(rb'addserver ([0-9\.]+) ([0-9]+) ([0-9-]+) "([^"]+)" "([^"]*)" "([^"]*)" "([^"]*)"', line)
+
+        if not match:
+            raise ValueError("Invalid addserver response", line)
+
+        return RedEclipseServer(
+            *[i.decode("cube2") for i in match.groups()],
+            remote_master_server=self._remote_master_server
+        )
+
+
+def make_dump():
+    lines = [b"setversion 160 230\n", b"clearservers\n"]
+
+    for i in range(LINES_COUNT):
+        lines.append(b'addserver 10.%d.%d.%d 28801 %d "\x0cyServer #%d \xe9" "handle%d" "" "stable"\n' % (
+            i // 65536, i // 256 % 256, i % 256, i % 3, i, i
+        ))
+
+    return lines
+
+
+def bench(parser_class, lines):
+    best = None
+
+    for _ in range(ROUNDS):
+        parser = parser_class(None)
+
+        started = time.perf_counter()
+
+        for line in lines:
+            parser.parse_line(line)
+
+        duration = time.perf_counter() - started
+
+        if best is None or duration < best:
+            best = duration
+
+    return best
+
+
+def main():
+    lines = make_dump()
+
+    # both parsers must agree
+    for line in lines:
+        legacy = LegacyServerListParser(None).parse_line(line)
+        parsed = ServerListParser(None).parse_line(line)
+
+        assert (legacy is None and parsed is None) or legacy.to_json_dict() == parsed.to_json_dict()
+
+    legacy_duration = bench(LegacyServerListParser, lines)
+    duration = bench(ServerListParser, lines)
+
+    print("legacy parser:  %.3f s (%.0f lines/s)" % (legacy_duration, len(lines) / legacy_duration))
+    print("current parser: %.3f s (%.0f lines/s)" % (duration, len(lines) / duration))
+    print("speedup: %.2fx" % (legacy_duration / duration))
+
+
+if __name__ == "__main__":
+    main()
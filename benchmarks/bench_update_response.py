@@ -0,0 +1,68 @@
+# Measures how many update requests per second the master server can answer with 5k servers listed, with and without
+# the cached response.
+#
+# Run with: python benchmarks/bench_update_response.py
+
+import asyncio
+import time
+
+from masterserver import MasterServer
+from masterserver.rate_limiter import RateLimiter
+from masterserver.red_eclipse_server import RedEclipseServer
+from masterserver.server_registry import ServerListSnapshot
+
+
+SERVERS_COUNT = 5000
+CLIENTS_COUNT = 20
+DURATION = 5
+
+
+async def run_clients(ms: MasterServer, invalidate_cache: bool) -> float:
+    requests_count = 0
+    deadline = time.monotonic() + DURATION
+
+    async def client():
+        nonlocal requests_count
+
+        while time.monotonic() < deadline:
+            if invalidate_cache:
+                # replacing the snapshot discards the cached response
+                snapshot = ms.servers
+                ms._servers._snapshot = ServerListSnapshot(snapshot.generation, snapshot.servers)
+
+            reader, writer = await asyncio.open_connection("127.0.0.1", ms.port)
+            writer.write(b"update\n")
+            await reader.read()
+            writer.close()
+            await writer.wait_closed()
+
+            requests_count += 1
+
+    await asyncio.gather(*[client() for _ in range(CLIENTS_COUNT)])
+
+    return requests_count / DURATION
+
+
+async def main():
+    # all clients connect from localhost, which the default budgets would throttle after a few requests
+    ms = MasterServer(port=28900, rate_limiter=RateLimiter({"update": (1e9, 1e9)}))
+
+    for i in range(SERVERS_COUNT):
+        ms._servers.upsert(RedEclipseServer(
+            "10.%d.%d.%d" % (i >> 16 & 0xff, i >> 8 & 0xff, i & 0xff), 28801,
+            10, "Einherjer Europe [linuxiuvat.de] #%d" % i, "", "", "stable"
+        ))
+
+    await ms.start_server()
+
+    try:
+        print("%d servers listed, %d bytes per response" % (SERVERS_COUNT, len(ms.update_response())))
+        print("uncached: %8.1f requests/s" % await run_clients(ms, invalidate_cache=True))
+        print("cached:   %8.1f requests/s" % await run_clients(ms, invalidate_cache=False))
+
+    finally:
+        await ms.stop_server()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -31,16 +31,43 @@ else:
 setup_logging(force_colors=True, loglevel=loglevel)
 
 
+# if the backup is younger than this many seconds, its entries are listed right away on startup
+try:
+    serve_backup_max_age = float(os.environ["SERVE_BACKUP_MAX_AGE"])
+except KeyError:
+    serve_backup_max_age = None
+
 if len(sys.argv) > 1:
-    ms = MasterServer(backup_file=sys.argv[1])
+    ms = MasterServer(backup_file=sys.argv[1], serve_backup_max_age=serve_backup_max_age)
 else:
     ms = MasterServer()
 
 
 async def handle(request):
+    # the list can be filtered by branch, e.g., /?branch=stable
+    branch = request.query.get("branch")
+
+    if branch is None:
+        servers = ms.servers
+    else:
+        servers = ms.servers_by_branch(branch)
+
     data = {
         "servers": [
-            i.to_json_dict() for i in ms.servers
+            i.to_json_dict() for i in servers
+        ]
+    }
+
+    text = json.dumps(data, indent=4)
+
+    return web.Response(text=text, content_type="application/json")
+
+
+async def handle_proxied(request):
+    # polling statistics of the proxied master servers
+    data = {
+        "proxied_master_servers": [
+            i.to_json_dict() for i in ms.proxied_master_servers
         ]
     }
 
@@ -49,8 +76,22 @@ async def handle(request):
     return web.Response(text=text, content_type="application/json")
 
 
+async def handle_connections(request):
+    # connection statistics
+    data = ms.connection_limits.to_json_dict()
+    data["rate_limited"] = ms.rate_limiter.limited
+
+    text = json.dumps(data, indent=4)
+
+    return web.Response(text=text, content_type="application/json")
+
+
 app = web.Application()
-app.add_routes([web.get("/", handle)])
+app.add_routes([
+    web.get("/", handle),
+    web.get("/proxied", handle_proxied),
+    web.get("/connections", handle_connections),
+])
 
 for server in os.environ.get("PROXIED_SERVERS", "").split(","):
     if not server:
@@ -58,6 +99,20 @@ for server in os.environ.get("PROXIED_SERVERS", "").split(","):
 
     ms.add_server_to_proxy(server, 28800)
 
+# entries of trusted master servers are listed without verifying them first
+for server in os.environ.get("TRUSTED_PROXIED_SERVERS", "").split(","):
+    if not server:
+        continue
+
+    ms.add_server_to_proxy(server, 28800, trusted=True)
+
+# other instances of this master server to exchange registrations with
+for server in os.environ.get("PEERS", "").split(","):
+    if not server:
+        continue
+
+    ms.add_peer(server, 28800)
+
 
 if __name__ == "__main__":
     # make sure to run everything on the same event loop
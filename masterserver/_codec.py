@@ -37,17 +37,58 @@ class Cube2Codec(codecs.Codec):
     ]
 
     @classmethod
-    def encode(cls, string: str, **kwargs) -> Tuple[bytes, int]:
-        encoded = b"".join([bytes([cls.CUBE2UNICHARS.index(ord(char))]) for char in string])
-        assert len(encoded) == len(string)
-        return encoded, len(string)
+    def encode(cls, string: str, errors: str = "strict") -> Tuple[bytes, int]:
+        return codecs.charmap_encode(string, errors, ENCODING_TABLE)
 
     @classmethod
-    def decode(cls, binary: bytes, **kwargs) -> Tuple[str, int]:
-        decoded = "".join([chr(cls.CUBE2UNICHARS[char]) for char in binary])
-        assert len(decoded) == len(binary)
-        return decoded, len(binary)
+    def decode(cls, binary: bytes, errors: str = "strict") -> Tuple[str, int]:
+        return codecs.charmap_decode(binary, errors, DECODING_TABLE)
+
+
+# lookup tables used by the charmap codec functions
+# since every byte maps to exactly one character, decoding never needs to check any bounds, and encoding is a single
+# hash lookup per character instead of a scan through the list above
+DECODING_TABLE = "".join(chr(i) for i in Cube2Codec.CUBE2UNICHARS)
+ENCODING_TABLE = codecs.charmap_build(DECODING_TABLE)
+
+
+# the codec is stateless, therefore the incremental and stream variants can just wrap the functions above
+class Cube2IncrementalEncoder(codecs.IncrementalEncoder):
+    def encode(self, input: str, final: bool = False) -> bytes:
+        return codecs.charmap_encode(input, self.errors, ENCODING_TABLE)[0]
+
+
+class Cube2IncrementalDecoder(codecs.IncrementalDecoder):
+    def decode(self, input: bytes, final: bool = False) -> str:
+        return codecs.charmap_decode(input, self.errors, DECODING_TABLE)[0]
+
+
+class Cube2StreamWriter(Cube2Codec, codecs.StreamWriter):
+    pass
+
+
+class Cube2StreamReader(Cube2Codec, codecs.StreamReader):
+    pass
+
+
+def _search_function(encoding: str):
+    if encoding != "cube2":
+        return None
+
+    return codecs.CodecInfo(
+        name="cube2",
+        encode=Cube2Codec.encode,
+        decode=Cube2Codec.decode,
+        incrementalencoder=Cube2IncrementalEncoder,
+        incrementaldecoder=Cube2IncrementalDecoder,
+        streamwriter=Cube2StreamWriter,
+        streamreader=Cube2StreamReader,
+    )
 
 
 def register_codec():
-    codecs.register(lambda _: codecs.CodecInfo(Cube2Codec.encode, Cube2Codec.decode, name="cube2"))
+    # registering the same search function more than once is harmless, but would make every lookup slower
+    try:
+        codecs.lookup("cube2")
+    except LookupError:
+        codecs.register(_search_function)
@@ -1,9 +1,14 @@
+import asyncio
 import json
+import os
+import time
 from collections import namedtuple
-from typing import Dict
+from typing import Dict, Tuple, Union
 
 import bn_crypto
 
+from . import get_logger
+
 
 AuthRequest = namedtuple("AuthRequest", ["user_name", "challenge", "expected_answer"])
 
@@ -11,27 +16,126 @@ AuthDBEntry = namedtuple("AuthDBEntry", ["pubkey", "flags"])
 
 
 class AuthStorage:
-    @classmethod
-    def get_user(cls, user_name: str):
+    """
+    User database, read from a JSON file.
+
+    The users are kept in memory, so lookups don't touch the disk. refresh() checks whether the file has been replaced
+    or modified (by comparing its inode, modification time and size), and if so, reads it again in a worker thread, so
+    the event loop isn't blocked. If the new file cannot be read, the users read last are kept.
+    """
+
+    _logger = get_logger("auth-storage")
+
+    def __init__(self, path: str = "auth.json", check_interval: float = 1):
+        self._path: str = path
+
+        # the file is checked at most this often
+        self._check_interval: float = check_interval
+        self._last_check: Union[float, None] = None
+
+        # users by name, None for entries which have an invalid format
+        self._users: Dict[str, Union[AuthDBEntry, None]] = {}
+
+        # inode, modification time and size of the file read last
+        self._file_state: Union[Tuple[int, int, int], None] = None
+
+        # concurrent refreshes wait for the one in progress
+        self._lock = asyncio.Lock()
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def __len__(self):
+        return len(self._users)
+
+    def _get_file_state(self) -> Union[Tuple[int, int, int], None]:
         try:
-            with open("auth.json", "r") as f:
-                data = json.load(f)
+            stat = os.stat(self._path)
+        except OSError:
+            return None
+
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _load(self) -> Dict[str, Union[AuthDBEntry, None]]:
+        with open(self._path, "r") as f:
+            data = json.load(f)
+
+        if not isinstance(data, dict):
+            raise ValueError("auth db must contain an object")
+
+        users = {}
+
+        for user_name, user_data in data.items():
+            try:
+                users[user_name] = AuthDBEntry(user_data["pubkey"], user_data["flags"])
+            except (KeyError, TypeError):
+                users[user_name] = None
+
+        return users
+
+    def _reload_if_changed(self) -> bool:
+        """
+        Blocking, should be run in an executor.
+
+        :return: whether the users have been read again
+        """
 
-            user_data = data[user_name]
+        file_state = self._get_file_state()
 
+        if file_state == self._file_state:
+            return False
+
+        if file_state is None:
+            self._logger.warning("auth db %s not found", self._path)
+            users = {}
+
+        else:
             try:
-                user = AuthDBEntry(user_data["pubkey"], user_data["flags"])
-            except KeyError:
-                raise ValueError("invalid user format")
+                users = self._load()
+
+            except (OSError, ValueError):
+                self._logger.exception("failed to read auth db %s, keeping previous state", self._path)
+                return False
+
+        self._users = users
+        self._file_state = file_state
+
+        return True
+
+    async def refresh(self):
+        """
+        Reads the user database again if the file has changed since it has been read last.
+        """
+
+        async with self._lock:
+            now = time.monotonic()
+
+            if self._last_check is not None and now - self._last_check < self._check_interval:
+                return
+
+            self._last_check = now
+
+            if await asyncio.get_event_loop().run_in_executor(None, self._reload_if_changed):
+                self._logger.info("read %d users from auth db %s", len(self._users), self._path)
+
+    def get_user(self, user_name: str) -> AuthDBEntry:
+        """
+        :param user_name: name of the user
+        :return: the user's entry
+        :raises KeyError: if the user is not known
+        :raises ValueError: if the user's entry is invalid
+        """
+
+        user = self._users[user_name]
 
-            return user
+        if user is None:
+            raise ValueError("invalid user format")
 
-        except IOError:
-            raise KeyError("auth db not found")
+        return user
 
-    @classmethod
-    def generate_auth_challenge(cls, user_name: str) -> AuthRequest:
-        pubkey = cls.get_user(user_name).pubkey
+    def generate_auth_challenge(self, user_name: str) -> AuthRequest:
+        pubkey = self.get_user(user_name).pubkey
         challenge, expected_answer = bn_crypto.generate_auth_challenge(pubkey)
         return AuthRequest(user_name, challenge, expected_answer)
 
@@ -45,6 +149,5 @@ class AuthStorage:
 
         return reply_num == expected_answer_num
 
-    @classmethod
-    def get_user_flags(cls, user_name: str):
-        return "".join(cls.get_user(user_name).flags)
+    def get_user_flags(self, user_name: str):
+        return "".join(self.get_user(user_name).flags)
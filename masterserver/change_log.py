@@ -0,0 +1,97 @@
+import asyncio
+import itertools
+import random
+from collections import deque
+from typing import Deque, List, Union
+
+from .red_eclipse_server import RedEclipseServer
+
+
+class ChangeLogEntry:
+    __slots__ = ("seq", "server", "removed")
+
+    def __init__(self, seq: int, server: RedEclipseServer, removed: bool):
+        self.seq = seq
+        self.server = server
+        self.removed = removed
+
+
+class ChangeLog:
+    """
+    Sequenced log of the changes to a set of servers, used to send peers only what has changed since they synced last.
+
+    Every change gets the next sequence number. Only the most recent changes are kept, a peer which falls behind
+    further than that has to resync the complete set. Since the sequence numbers start over whenever the master server
+    is restarted, each log has a random epoch, so peers can tell whether their sequence number refers to this log.
+    """
+
+    def __init__(self, max_length: int = 10000):
+        self._epoch: str = "%08x" % random.getrandbits(32)
+        self._seq: int = 0
+        self._entries: Deque[ChangeLogEntry] = deque(maxlen=max_length)
+
+        # set and replaced whenever a change is recorded, see wait()
+        self._changed: Union[asyncio.Event, None] = None
+
+    @property
+    def epoch(self) -> str:
+        return self._epoch
+
+    @property
+    def seq(self) -> int:
+        return self._seq
+
+    def record(self, server: RedEclipseServer, removed: bool = False):
+        """
+        :param server: server which has been added or updated, or removed
+        :param removed: whether the server has been removed
+        """
+
+        self._seq += 1
+        self._entries.append(ChangeLogEntry(self._seq, server, removed))
+
+        if self._changed is not None:
+            self._changed.set()
+            self._changed = None
+
+    def since(self, seq: int) -> Union[List[ChangeLogEntry], None]:
+        """
+        :param seq: last sequence number the caller knows about
+        :return: changes after the given sequence number, or None if they are not available (any more)
+        """
+
+        if seq > self._seq:
+            return None
+
+        if seq == self._seq:
+            return []
+
+        # the sequence numbers of the entries are consecutive
+        first_seq = self._entries[0].seq if self._entries else self._seq + 1
+
+        if seq < first_seq - 1:
+            return None
+
+        return list(itertools.islice(self._entries, seq - first_seq + 1, None))
+
+    async def wait(self, seq: int, timeout: float) -> bool:
+        """
+        Waits for changes after the given sequence number.
+
+        :param seq: last sequence number the caller knows about
+        :param timeout: seconds to wait at most
+        :return: whether changes are available
+        """
+
+        if self._seq != seq:
+            return True
+
+        if self._changed is None:
+            self._changed = asyncio.Event()
+
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+
+        return True
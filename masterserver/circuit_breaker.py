@@ -0,0 +1,69 @@
+import time
+from typing import Union
+
+
+class CircuitBreaker:
+    """
+    Stops calls to a peer which keeps failing for a while.
+
+    After a given number of consecutive failures, the circuit opens, and calls are rejected until a backoff time has
+    passed. Then, a single trial call is permitted. If it fails as well, the circuit opens again, and the backoff is
+    doubled, up to a maximum. A successful call closes the circuit and resets the backoff.
+    """
+
+    def __init__(self, failure_threshold: int = 3, backoff: float = 60, max_backoff: float = 3600):
+        if failure_threshold < 1:
+            raise ValueError("failure threshold must be at least 1")
+
+        self._failure_threshold: int = failure_threshold
+        self._initial_backoff: float = float(backoff)
+        self._max_backoff: float = float(max_backoff)
+
+        self._consecutive_failures: int = 0
+        self._backoff: float = self._initial_backoff
+
+        # monotonic time until which calls are rejected, None while the circuit is closed
+        self._open_until: Union[float, None] = None
+
+    @property
+    def consecutive_failures(self) -> int:
+        return self._consecutive_failures
+
+    @property
+    def is_open(self) -> bool:
+        return self._open_until is not None
+
+    @property
+    def retry_in(self) -> float:
+        """
+        :return: seconds until the next trial call is permitted, 0 if calls are permitted right now
+        """
+
+        if self._open_until is None:
+            return 0
+
+        return max(0.0, self._open_until - time.monotonic())
+
+    def allow(self) -> bool:
+        """
+        :return: whether a call may be made right now
+        """
+
+        return self._open_until is None or time.monotonic() >= self._open_until
+
+    def record_success(self):
+        self._consecutive_failures = 0
+        self._backoff = self._initial_backoff
+        self._open_until = None
+
+    def record_failure(self):
+        self._consecutive_failures += 1
+
+        if self._open_until is not None:
+            # the trial call failed, back off further
+            self._backoff = min(self._max_backoff, self._backoff * 2)
+
+        elif self._consecutive_failures < self._failure_threshold:
+            return
+
+        self._open_until = time.monotonic() + self._backoff
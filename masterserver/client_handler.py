@@ -1,3 +1,4 @@
+import asyncio
 import re
 from asyncio import StreamReader, StreamWriter
 
@@ -6,11 +7,10 @@ from . import get_logger
 from typing import TYPE_CHECKING, Dict
 
 from .auth import AuthStorage, AuthRequest
-from .exceptions import CommandError, InvalidCommandError, UnknownCommandError
+from .exceptions import CommandError, InvalidCommandError, RateLimitExceededError, UnknownCommandError
 
 if TYPE_CHECKING:
     from masterserver import MasterServer
-    from masterserver.red_eclipse_server import RedEclipseServer
 
 
 class ClientHandlerBase:
@@ -23,6 +23,60 @@ class ClientHandlerBase:
 
         self._client_data = self._writer.get_extra_info("peername")
 
+        self._limits = self._master_server.connection_limits
+
+    # classes of commands which are rate limited separately, see RateLimiter
+    _COMMAND_CLASSES = {
+        "update": "update",
+        "server": "server",
+        "reqauth": "auth",
+        "confauth": "auth",
+        "peersync": "peer",
+    }
+
+    def _check_rate_limit(self, command: str):
+        """
+        :param command: command received
+        :raises RateLimitExceededError: if the client has sent too many commands of this class
+        """
+
+        command_class = self._COMMAND_CLASSES.get(command.split(" ")[0])
+
+        if command_class is None:
+            return
+
+        ip_addr = self._client_data[0]
+
+        if not self._master_server.rate_limiter.try_acquire(command_class, ip_addr):
+            raise RateLimitExceededError(command)
+
+    async def _write(self, data: bytes):
+        """
+        Writes data to the client, waiting for the client to accept it. Large responses are written in chunks, so no
+        more than one chunk is buffered per connection.
+
+        :param data: data to write
+        :raises asyncio.TimeoutError: if the client doesn't accept the data within the write timeout
+        """
+
+        chunk_size = self._limits.write_buffer_size
+
+        # slicing a memoryview doesn't copy the data, which is usually a cached response shared by all connections
+        view = memoryview(data)
+
+        for offset in range(0, len(view), chunk_size):
+            self._writer.write(view[offset:offset + chunk_size])
+            await asyncio.wait_for(self._writer.drain(), self._limits.write_timeout)
+
+    async def _read_command(self, timeout: float) -> str:
+        """
+        :param timeout: seconds to wait for the command
+        :return: next command, or an empty string if the connection has been closed
+        :raises asyncio.TimeoutError: if no command has been received within the timeout
+        """
+
+        return (await asyncio.wait_for(self._reader.readline(), timeout)).decode().rstrip("\n")
+
     async def handle_generic_connection(self):
         raise NotImplementedError()
 
@@ -59,7 +113,22 @@ class ServerClientHandler(ClientHandlerBase):
 
                 return
 
-            elif command.startswith("server "):
+            # servers keep their connections open, so every command needs to be checked
+            try:
+                self._check_rate_limit(command)
+
+            except RateLimitExceededError:
+                # closing the connection would delist a registered server, therefore only the command is rejected
+                if re_server is None:
+                    raise
+
+                self._logger.warning("Rate limit exceeded by server %r: %s", re_server, command)
+                await self._reject_command(command)
+
+                command = await self._read_next_command()
+                continue
+
+            if command.startswith("server "):
                 match = re.match(r'server ([0-9a-fA-F+-]+) ([^\s]+) ([0-9a-fA-F+-]+) "([^"]*)" ([0-9a-fA-F+-]+) "([^"]*)"', command)
 
                 if not match:
@@ -68,11 +137,19 @@ class ServerClientHandler(ClientHandlerBase):
                 host, _ = self._writer.get_extra_info("peername")
                 port, serverip, version, _, _, branch = match.groups()
 
-                self._logger.info("Received registration request for server %s:%d", host, int(port))
+                try:
+                    port = int(port)
+                except ValueError:
+                    raise InvalidCommandError(command)
+
+                if not 0 <= port <= 65535:
+                    raise InvalidCommandError(command)
+
+                self._logger.info("Received registration request for server %s:%d", host, port)
 
                 # try to register server
                 # if the registration fails, we'll receive None as return value
-                re_server = await self._master_server.register_server(host, serverip, int(port), branch)
+                re_server = await self._master_server.register_server(host, serverip, port, branch)
 
                 if re_server is not None:
                     reply = "Successfully pinged (%s:%d), server is now listed" % (
@@ -82,7 +159,7 @@ class ServerClientHandler(ClientHandlerBase):
                 else:
                     reply = "Error: Pinging failed, server will not be listed"
 
-                self._writer.write('echo "{}"\n'.format(reply).encode("cube2"))
+                await self._write('echo "{}"\n'.format(reply).encode("cube2"))
 
             elif command.startswith("reqauth "):
                 match = re.match(r'reqauth ([0-9a-fA-F+-]+) ([^\s]+) ([^\s]+)', command)
@@ -100,13 +177,18 @@ class ServerClientHandler(ClientHandlerBase):
                 except ValueError:
                     raise InvalidCommandError(command)
 
+                auth_storage = self._master_server.auth_storage
+
+                # picks up changes to the user database, without blocking the event loop
+                await auth_storage.refresh()
+
                 try:
-                    auth_request = AuthStorage.generate_auth_challenge(user_name)
+                    auth_request = auth_storage.generate_auth_challenge(user_name)
 
                 except KeyError:
                     # we don't support authentication yet
                     # a protocol conform behavior is to just send auth failures for all requests
-                    self._writer.write('failauth {}\n'.format(request_id).encode("cube2"))
+                    await self._write('failauth {}\n'.format(request_id).encode("cube2"))
 
                     self._logger.info("auth request no. %d failed for user %s on server %s: unknown user",
                         request_id,
@@ -116,7 +198,7 @@ class ServerClientHandler(ClientHandlerBase):
 
                 else:
                     self._auth_requests[request_id] = auth_request
-                    self._writer.write('chalauth {} {}\n'.format(request_id, auth_request.challenge).encode("cube2"))
+                    await self._write('chalauth {} {}\n'.format(request_id, auth_request.challenge).encode("cube2"))
                     self._logger.debug("Generated auth challenge for user {}, request ID {}: {}".format(
                         user_name, request_id, auth_request.challenge
                     ))
@@ -139,23 +221,23 @@ class ServerClientHandler(ClientHandlerBase):
 
                 self._logger.debug("received {}".format(command))
 
-                def fail_auth():
-                    self._writer.write("failauth {}\n".format(request_id).encode("cube2"))
-                    del self._auth_requests[request_id]
+                async def fail_auth():
+                    self._auth_requests.pop(request_id, None)
+                    await self._write("failauth {}\n".format(request_id).encode("cube2"))
 
                 try:
                     auth_request = self._auth_requests[request_id]
 
                 except KeyError:
                     self._logger.error("received confauth for unknown request ID {}".format(request_id))
-                    fail_auth()
+                    await fail_auth()
 
                 else:
                     if AuthStorage.validate_auth_reply(reply, auth_request):
-                        flags = AuthStorage.get_user_flags(auth_request.user_name)
+                        flags = self._master_server.auth_storage.get_user_flags(auth_request.user_name)
 
                         message = "succauth {} \"{}\" \"{}\"\n".format(request_id, auth_request.user_name, flags)
-                        self._writer.write(message.encode("cube2"))
+                        await self._write(message.encode("cube2"))
 
                         self._logger.info("auth succeeded {} [{}] ({}) on server {}".format(
                             auth_request.user_name, flags, request_id, self._client_data
@@ -163,30 +245,76 @@ class ServerClientHandler(ClientHandlerBase):
 
                     else:
                         self._logger.info("auth failed [{}] on server {}".format(request_id, self._client_data))
-                        fail_auth()
+                        await fail_auth()
 
             else:
                 raise UnknownCommandError(command)
 
-            # read next command
-            command = (await self._reader.readline()).decode().rstrip("\n")
+            command = await self._read_next_command()
 
+    async def _reject_command(self, command: str):
+        """
+        Reply to a command which isn't processed. Auth requests are failed, so the players don't wait for a reply.
 
-class ClientHandler(ClientHandlerBase):
-    async def _handle_update_command(self):
-        lines = [
-            "setversion 160 230",
-            "clearservers",
-        ]
+        :param command: rejected command
+        """
+
+        match = re.match(r'(?:reqauth|confauth) ([0-9a-fA-F+-]+) ', command)
+
+        if match:
+            await self._write("failauth {}\n".format(match.group(1)).encode("cube2"))
+
+        else:
+            await self._write('error "{}"\n'.format(RateLimitExceededError(command)).encode("cube2"))
+
+    async def _read_next_command(self) -> str:
+        """
+        :return: next command, or an empty string if the connection has been lost
+        """
+
+        # servers keep their connection open, but a server which doesn't send anything for too long is considered
+        # dead
+        try:
+            return await self._read_command(self._limits.idle_timeout)
+
+        except asyncio.TimeoutError:
+            self._limits.record_timeout()
+            self._logger.warning("Connection to client %r idle for too long", self._client_data)
+            return ""
 
-        server: RedEclipseServer
-        for server in self._master_server.servers:
-            lines.append("addserver %s" % server.addserver_line())
 
-        response = "\n".join(lines)
-        response += "\n"
+class PeerClientHandler(ClientHandlerBase):
+    """
+    "Subhandler" for connections of peers, which keep their connection open and request changes repeatedly. See
+    PeerMasterServer for a description of the protocol.
+    """
+
+    async def handle_peer(self, first_command: str):
+        command = first_command
+
+        while command:
+            # peers keep their connections open, so every command needs to be checked
+            self._check_rate_limit(command)
 
-        self._writer.write(response.encode("cube2"))
+            match = re.match(r'peersync ([0-9a-f]+|-) ([0-9]+)$', command)
+
+            if not match:
+                raise InvalidCommandError(command)
+
+            epoch, seq = match.groups()
+
+            await self._write(await self._master_server.peer_sync_response(epoch, int(seq)))
+
+            # read next command
+            command = await self._read_command(self._limits.idle_timeout)
+
+        self._logger.info("peer %r closed connection", self._client_data)
+
+
+class ClientHandler(ClientHandlerBase):
+    async def _handle_update_command(self):
+        # the response is rendered only when the server list changes
+        await self._write(self._master_server.update_response())
 
         self._logger.info("closing connection from client %r", self._client_data)
 
@@ -194,7 +322,11 @@ class ClientHandler(ClientHandlerBase):
         try:
             self._logger.info("client connected: %r", self._client_data)
 
-            first_command = (await self._reader.readline()).decode().rstrip("\n")
+            first_command = await self._read_command(self._limits.read_timeout)
+
+            if first_command == "update":
+                # other rate limited commands are checked by the server handler
+                self._check_rate_limit(first_command)
 
             # nagios-like monitoring for instance just probe whether the port is available, and send no message
             if first_command.strip(" \r\n") == "":
@@ -211,6 +343,10 @@ class ClientHandler(ClientHandlerBase):
                 server_handler = ServerClientHandler(self._master_server, self._reader, self._writer)
                 await server_handler.handle_server(first_command)
 
+            elif first_command.startswith("peersync "):
+                peer_handler = PeerClientHandler(self._master_server, self._reader, self._writer)
+                await peer_handler.handle_peer(first_command)
+
             else:
                 raise UnknownCommandError(first_command)
 
@@ -218,6 +354,10 @@ class ClientHandler(ClientHandlerBase):
             self._writer.write('error "{}"\n'.format(str(e)).encode("cube2"))
             self._logger.warning("\"%s\" error from client %r, closing connection", str(e), self._client_data)
 
+        except asyncio.TimeoutError:
+            self._limits.record_timeout()
+            self._logger.warning("timeout on connection from client %r, closing connection", self._client_data)
+
         finally:
             self._writer.close()
             await self._writer.wait_closed()
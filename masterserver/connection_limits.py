@@ -0,0 +1,94 @@
+class ConnectionLimits:
+    """
+    Limits for client connections, and statistics about them.
+
+    The number of concurrent connections is capped, connections beyond the cap are rejected. Clients must send their
+    first command within the read timeout. Servers and peers, which keep their connections open, must send another
+    command within the idle timeout. Writes must be accepted by the client within the write timeout. Responses are
+    written in chunks of at most the write buffer size, waiting for the client to accept each chunk, so a slow client
+    cannot make us buffer a lot of data.
+    """
+
+    def __init__(self, max_connections: int = 1024, read_timeout: float = 10, idle_timeout: float = 65 * 60,
+                 write_timeout: float = 30, write_buffer_size: int = 64 * 1024):
+        self._max_connections: int = max_connections
+        self._read_timeout: float = read_timeout
+
+        # game servers update their registration once per hour, which must not run into the timeout
+        self._idle_timeout: float = idle_timeout
+
+        self._write_timeout: float = write_timeout
+        self._write_buffer_size: int = write_buffer_size
+
+        # statistics
+        self._active: int = 0
+        self._accepted: int = 0
+        self._rejected: int = 0
+        self._timed_out: int = 0
+
+    @property
+    def max_connections(self) -> int:
+        return self._max_connections
+
+    @property
+    def read_timeout(self) -> float:
+        return self._read_timeout
+
+    @property
+    def idle_timeout(self) -> float:
+        return self._idle_timeout
+
+    @property
+    def write_timeout(self) -> float:
+        return self._write_timeout
+
+    @property
+    def write_buffer_size(self) -> int:
+        return self._write_buffer_size
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def accepted(self) -> int:
+        return self._accepted
+
+    @property
+    def rejected(self) -> int:
+        return self._rejected
+
+    @property
+    def timed_out(self) -> int:
+        return self._timed_out
+
+    def try_acquire(self) -> bool:
+        """
+        Accounts for a new connection, unless the cap has been reached already. Every successful call must be followed
+        by a call to release() once the connection is closed.
+
+        :return: whether the connection may be accepted
+        """
+
+        if self._active >= self._max_connections:
+            self._rejected += 1
+            return False
+
+        self._active += 1
+        self._accepted += 1
+        return True
+
+    def release(self):
+        self._active -= 1
+
+    def record_timeout(self):
+        self._timed_out += 1
+
+    def to_json_dict(self) -> dict:
+        return {
+            "max_connections": self._max_connections,
+            "active": self._active,
+            "accepted": self._accepted,
+            "rejected": self._rejected,
+            "timed_out": self._timed_out,
+        }
@@ -18,3 +18,8 @@ class UnknownCommandError(CommandError):
 class InvalidCommandError(CommandError):
     def __str__(self):
         return "Invalid command: %s" % self.command
+
+
+class RateLimitExceededError(CommandError):
+    def __str__(self):
+        return "Rate limit exceeded: %s" % self.command
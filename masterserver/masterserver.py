@@ -1,26 +1,53 @@
 import asyncio
-import itertools
 import sys
+import time
 from asyncio import StreamReader, StreamWriter, Lock, AbstractServer, Task
+from collections import Counter
 from ipaddress import IPv4Address, AddressValueError
-from typing import List, Tuple, Union, Set
+from typing import Dict, List, Tuple, Union, Set
 
 from . import get_logger
+from .auth import AuthStorage
 from .client_handler import ClientHandler
-from .parsed_query_reply import ParsedQueryReply
+from .connection_limits import ConnectionLimits
+from .negative_cache import NegativeCache
+from .parsed_query_reply import ParsedQueryReply, TruncatedQueryReplyError, parse_many_async
+from .peer_master_server import PeerMasterServer
+from .ping_history import PingHistory
+from .ping_scheduler import PingScheduler
+from .ping_sweep import PingSweep
+from .proxied_master_server import ProxiedMasterServer
+from .rate_limiter import RateLimiter
 from .red_eclipse_server import RedEclipseServer
 from .remote_master_server import RemoteMasterServer
-from .server_pinger import ServerPinger, PingError
+from .server_pinger import ServerPinger, PingError, PingService, PingResult
+from .server_registry import ServerRegistry, ServerListSnapshot
+from .state_backup import StateBackup
 
 
 class MasterServer:
     _logger = get_logger()
 
-    def __init__(self, port: int = None, backup_file: str = None):
-        self._proxied_master_servers: List[Tuple[str, int]] = []
+    # entries of trusted master servers are pinged only every n-th interval
+    TRUSTED_PING_INTERVAL_MULTIPLIER = 10
+
+    # peers waiting for changes get an empty reply after this many seconds, which keeps idle connections alive
+    PEER_SYNC_WAIT = 10
+
+    def __init__(self, port: int = None, backup_file: str = None, ping_interval: float = 60,
+                 ping_concurrency: int = 100, ping_packets_per_second: float = 500,
+                 serve_backup_max_age: float = None, connection_limits: ConnectionLimits = None,
+                 rate_limiter: RateLimiter = None, negative_cache: NegativeCache = None,
+                 auth_db_file: str = "auth.json"):
+        # proxied master servers by (host, port)
+        self._proxied_master_servers: Dict[Tuple[str, int], ProxiedMasterServer] = {}
+
+        # peers by (host, port), see PeerMasterServer
+        self._peers: Dict[Tuple[str, int], PeerMasterServer] = {}
+
+        # complete list sent to peers which need a full resync, and the change log seq it has been rendered at
+        self._peer_reset_response: Union[Tuple[int, bytes], None] = None
 
-        # # FIXME: use set, should save some annoying list comparisons
-        # self._servers: List[RedEclipseServer] = []
         self._lock = Lock()
 
         if port is None:
@@ -28,6 +55,20 @@ class MasterServer:
 
         self._port: int = port
 
+        if connection_limits is None:
+            connection_limits = ConnectionLimits()
+
+        self._connection_limits: ConnectionLimits = connection_limits
+
+        if rate_limiter is None:
+            rate_limiter = RateLimiter()
+
+        # limits the rate of commands per client address, registrations in particular, which cause outgoing pings
+        self._rate_limiter: RateLimiter = rate_limiter
+
+        # users are read from the file once, and read again only if it changes
+        self._auth_storage: AuthStorage = AuthStorage(auth_db_file)
+
         # keep track of state of server
         # this way, we can run instances for testing
         self._started: bool = False
@@ -35,7 +76,7 @@ class MasterServer:
         self._running_server: Union[AbstractServer, None] = None
         self._running_tasks: Set[Task] = set()
 
-        self._servers: Set[RedEclipseServer] = set()
+        self._servers: ServerRegistry = ServerRegistry()
 
         # we store a backup of server:port pairs in this file every n seconds
         # on startup, when the proxied master servers haven't been contacted yet and "own" servers have not registered
@@ -44,43 +85,352 @@ class MasterServer:
         self._backup_file_path: str = backup_file
         self._backup_interval: int = 60
 
+        self._state_backup: Union[StateBackup, None] = None
+
+        # if the backup is younger than this many seconds, its entries are listed right away, and are verified by
+        # the regular pings later
+        self._serve_backup_max_age: Union[float, None] = serve_backup_max_age
+
+        if backup_file is not None:
+            self._state_backup = StateBackup(backup_file)
+
+        # all pings are sent through the sockets of this service while the server is running
+        # the amount of concurrent pings and outgoing packets is limited to avoid load spikes during sweeps
+        self._ping_service = PingService(packets_per_second=ping_packets_per_second)
+        self._ping_sweep = PingSweep(concurrency=ping_concurrency)
+
+        # pings currently in progress by (ip, port), see _ping()
+        self._pings_in_flight: Dict[Tuple[IPv4Address, int], Task] = {}
+
+        # instead of pinging all servers at once every interval, every server is pinged once per interval at its own
+        # point in time, which spreads the load evenly
+        self._ping_scheduler = PingScheduler(interval=ping_interval)
+
+        if negative_cache is None:
+            negative_cache = NegativeCache()
+
+        # servers which couldn't be reached recently are not verified again for a while
+        self._negative_cache: NegativeCache = negative_cache
+
+        # statistics of the current ping interval, logged once per interval
+        self._ping_stats_started: float = time.monotonic()
+        self._ping_stats_pinged: int = 0
+        self._ping_stats_unreachable: int = 0
+        self._ping_stats_probes_sent: int = 0
+        self._ping_stats_probes_saved: int = 0
+        self._ping_stats_pings_skipped: int = 0
+        self._ping_stats_pings_avoided: int = 0
+
+        # players and game modes reported by the servers which replied
+        self._ping_stats_players: int = 0
+        self._ping_stats_modes: Counter = Counter()
+
     @property
     def port(self):
         return self._port
 
-    def add_server_to_proxy(self, host: str, port: int = 28800):
-        self._proxied_master_servers.append((host, port))
+    @property
+    def proxied_master_servers(self) -> List[ProxiedMasterServer]:
+        return list(self._proxied_master_servers.values())
+
+    def add_server_to_proxy(self, host: str, port: int = 28800, trusted: bool = False):
+        """
+        :param host: host of the master server to proxy
+        :param port: port of the master server to proxy
+        :param trusted: list the master server's entries on its authority, see ProxiedMasterServer
+        """
+
+        self._proxied_master_servers[(host, port)] = ProxiedMasterServer(
+            RemoteMasterServer(host, port), trusted=trusted
+        )
+
+    @property
+    def peers(self) -> List[PeerMasterServer]:
+        return list(self._peers.values())
+
+    def add_peer(self, host: str, port: int = 28800):
+        """
+        Adds another instance of this master server to exchange registrations with.
+
+        The servers which registered with a peer are listed on the peer's authority. The peer pings them, and tells us
+        when they are removed, so they are not pinged by us.
+
+        :param host: host of the peer
+        :param port: port of the peer
+        """
+
+        self._peers[(host, port)] = PeerMasterServer(host, port)
+
+    def _is_trusted(self, remote_master_server: Union[RemoteMasterServer, None]) -> bool:
+        """
+        :param remote_master_server: master server to check, None for servers which registered with us directly
+        :return: whether the master server is proxied and trusted
+        """
+
+        if remote_master_server is None:
+            return False
+
+        proxied = self._proxied_master_servers.get((remote_master_server.host, remote_master_server.port))
+        return proxied is not None and proxied.trusted
+
+    def _schedule(self, server: RedEclipseServer):
+        # entries of peers are pinged by the peers
+        if isinstance(server.remote_master_server, PeerMasterServer):
+            return
+
+        # trusted master servers verify their entries already, we ping them only now and then to keep their ping
+        # histories up to date, so that our ping budget goes to the servers which registered with us directly
+        if self._is_trusted(server.remote_master_server):
+            self._ping_scheduler.schedule(server, self.TRUSTED_PING_INTERVAL_MULTIPLIER)
+        else:
+            self._ping_scheduler.schedule(server)
+
+    @property
+    def connection_limits(self) -> ConnectionLimits:
+        return self._connection_limits
+
+    @property
+    def rate_limiter(self) -> RateLimiter:
+        return self._rate_limiter
+
+    @property
+    def auth_storage(self) -> AuthStorage:
+        return self._auth_storage
 
     async def _handle_connection(self, reader: StreamReader, writer: StreamWriter):
         self._logger.debug("client connteced")
-        msc = ClientHandler(self, reader, writer)
-        await msc.handle_generic_connection()
+
+        if not self._connection_limits.try_acquire():
+            self._logger.warning("Too many connections, rejecting client %r", writer.get_extra_info("peername"))
+
+            writer.write(b'error "Too many connections"\n')
+            writer.close()
+            return
+
+        try:
+            msc = ClientHandler(self, reader, writer)
+            await msc.handle_generic_connection()
+
+        finally:
+            self._connection_limits.release()
 
     async def _poll_proxied_servers(self):
         self._logger.info("proxied servers polling task started")
 
-        # store tasks outside loop to be able to clean them up properly in case this task has been canceled
-        tasks = []
-
         try:
-            proxied_servers = [RemoteMasterServer(host, port) for host, port in self._proxied_master_servers]
+            proxied_servers = list(self._proxied_master_servers.values())
 
             self._logger.info("updating from proxied servers %r", proxied_servers)
 
-            tasks = [proxied_server.list_servers() for proxied_server in proxied_servers]
+            # every master server is polled independently, failures are handled by the proxied master server objects
+            results = await asyncio.gather(*[proxied_server.poll() for proxied_server in proxied_servers])
+
+            # the entries of master servers which couldn't be polled are kept until they can be polled again
+            await asyncio.gather(*[
+                self.merge_remote_list(proxied_server.remote_master_server, servers)
+                for proxied_server, servers in zip(proxied_servers, results) if servers is not None
+            ])
+
+        except asyncio.CancelledError:
+            self._logger.info("proxied servers polling task cancelled")
+            raise
+
+    async def merge_remote_list(self, remote_master_server: RemoteMasterServer, servers: List[RedEclipseServer]):
+        """
+        Merges the server list fetched from a remote master server into our list.
+
+        The changes against the remote master server's previous list are applied at once. Servers which haven't been
+        listed before are pinged, and added if they reply, unless the remote master server is trusted, in which case
+        they're added right away.
+
+        :param remote_master_server: master server the list has been fetched from
+        :param servers: servers listed by the remote master server
+        """
+
+        async with self._lock:
+            result = self._servers.merge_remote_list(remote_master_server, servers)
+
+            new_servers = result.new
+
+            if self._is_trusted(remote_master_server):
+                for server in new_servers:
+                    self._servers.upsert(server)
+                    self._schedule(server)
+
+                new_servers = []
+
+            for server in result.updated:
+                self._schedule(server)
+
+            for server in result.removed:
+                self._ping_scheduler.unschedule(server)
+
+        self._logger.debug(
+            "merged list of %r: %d new, %d updated, %d removed servers",
+            remote_master_server, len(result.new), len(result.updated), len(result.removed)
+        )
+
+        if new_servers:
+            await self._verify_new_servers(new_servers)
+
+    async def _verify_new_servers(self, servers: List[RedEclipseServer]):
+        """
+        Pings servers which aren't listed yet, and adds those which reply.
+
+        :param servers: servers to verify
+        """
+
+        async def ping_task(server: RedEclipseServer) -> Union[bytes, None]:
+            try:
+                return (await self._ping(server)).data
+
+            except (TimeoutError, PingError) as e:
+                self._logger.debug("ping failed for server %r, server will not be listed: %r", server, e)
+                return None
+
+        # servers which couldn't be reached recently would most likely time out again
+        servers = [server for server in servers if not self._negative_cache.should_skip(server)]
+
+        replies = await self._ping_sweep.run(servers, ping_task)
+
+        reachable = [(server, reply) for server, reply in zip(servers, replies) if reply is not None]
+        parsed = await parse_many_async(reply for _, reply in reachable)
+
+        for server, reply in zip(servers, replies):
+            if reply is None:
+                self._negative_cache.record_failure(server)
+
+        async with self._lock:
+            for (server, _), description in zip(reachable, parsed.descriptions):
+                if description is None:
+                    self._logger.warning("invalid reply from server %r, server will not be listed", server)
+                    self._negative_cache.record_failure(server)
+                    continue
+
+                self._negative_cache.record_success(server)
+
+                # the server might have been added by someone else while we were pinging it, e.g., it might have
+                # registered with us directly, which takes precedence
+                if server in self._servers:
+                    continue
 
-            results = await asyncio.gather(*tasks)
+                server.description = description
 
-            servers: List[RedEclipseServer] = list(itertools.chain.from_iterable(results))
+                self._servers.upsert(server)
+                self._schedule(server)
 
-            await asyncio.gather(*[self._add_or_update_server(server) for server in servers])
+        self._logger.info("verified %d of %d new servers", len(reachable), len(servers))
+
+    async def peer_sync_response(self, epoch: str, seq: int) -> bytes:
+        """
+        Renders the response to a peer's peersync command. If the peer is up to date, waits for changes first.
+
+        :param epoch: epoch of the change log the peer has synced with last, "-" if it hasn't synced yet
+        :param seq: sequence number of the last change the peer knows about
+        :return: cube2 encoded response
+        """
+
+        change_log = self._servers.change_log
+
+        if epoch == change_log.epoch:
+            await change_log.wait(seq, self.PEER_SYNC_WAIT)
+            changes = change_log.since(seq)
+        else:
+            changes = None
+
+        if changes is None:
+            # the peer has not synced with this change log yet, or has fallen behind too far, so it needs a full resync
+            # every change to our own servers is recorded in the change log, so the list is rendered once per seq
+            if self._peer_reset_response is None or self._peer_reset_response[0] != change_log.seq:
+                lines = ["peerreset %s %d" % (change_log.epoch, change_log.seq)]
+                lines += ["addserver %s" % server.addserver_line() for server in self._servers.own()]
+                lines.append("peerend")
+
+                response = ("\n".join(lines) + "\n").encode("cube2")
+                self._peer_reset_response = (change_log.seq, response)
+
+            return self._peer_reset_response[1]
+
+        lines = ["peerdelta %s %d" % (change_log.epoch, change_log.seq)]
+
+        for change in changes:
+            if change.removed:
+                lines.append("delserver %s %d" % (change.server.ip_addr, change.server.port))
+            else:
+                lines.append("addserver %s" % change.server.addserver_line())
+
+        lines.append("peerend")
+
+        return ("\n".join(lines) + "\n").encode("cube2")
+
+    def _create_peer_sync_task(self, peer: PeerMasterServer) -> Task:
+        async def sync_with_peer():
+            await self._sync_with_peer(peer)
+
+        # the peer replies as soon as there are changes, so there's no need to wait long between syncs
+        return self._create_task(sync_with_peer, 0.1)
+
+    async def _sync_with_peer(self, peer: PeerMasterServer):
+        if not peer.circuit_breaker.allow():
+            return
+
+        try:
+            update = await peer.sync(connect_timeout=5, read_timeout=self.PEER_SYNC_WAIT + 10)
 
         except asyncio.CancelledError:
-            self._logger.info("proxied servers polling task cancelled")
+            raise
+
+        except Exception as e:
+            peer.circuit_breaker.record_failure()
+            self._logger.warning("Failed to sync with %r: %r", peer, e)
+
+            if peer.circuit_breaker.is_open:
+                # we don't ping the peer's entries, so we can't tell which ones are still alive while the peer is
+                # unreachable, therefore they're removed, and the peer's complete list is requested once it's back
+                async with self._lock:
+                    removed = self._servers.merge_remote_list(peer, []).removed
+
+                peer.forget()
+
+                if removed:
+                    self._logger.warning("Removed %d servers of unreachable %r", len(removed), peer)
+
+            return
+
+        peer.circuit_breaker.record_success()
+
+        async with self._lock:
+            if update.reset:
+                # the peer's list replaces everything we have received from it so far
+                result = self._servers.merge_remote_list(peer, [change.server for change in update.changes])
+
+                for server in result.new:
+                    self._servers.upsert(server)
+
+            else:
+                # a server might have been removed and added again, so the changes must be applied in order
+                for server, removed in update.changes:
+                    old_server = self._servers.get(server)
+
+                    # servers which registered with us directly, and entries fetched from someone else first win
+                    if old_server is not None and old_server.remote_master_server != peer:
+                        continue
+
+                    if removed:
+                        if old_server is not None:
+                            self._servers.remove(old_server)
+
+                        continue
+
+                    if old_server is not None:
+                        server.ping_history = old_server.ping_history
 
-            for task in tasks:
-                task.close()
-                await task
+                    self._servers.upsert(server)
+
+        if update.reset or update.changes:
+            self._logger.debug(
+                "synced with %r (%s): %d changes", peer, "full" if update.reset else "delta", len(update.changes)
+            )
 
     async def start_server(self):
         if self._started:
@@ -97,45 +447,30 @@ class MasterServer:
         # start server
         self._running_server = await asyncio.start_server(self._handle_connection, port=self._port)
 
+        # restoring the state requires pinging servers already
+        await self._ping_service.start()
+
+        # read the user database before the first auth request comes in
+        await self._auth_storage.refresh()
+
         # restore state
-        if self._backup_file_path is None:
+        if self._state_backup is None:
             self._logger.warning("No backup file path provided, will not back up own state")
 
         else:
-            try:
-                with open(self._backup_file_path) as f:
-                    self._logger.info("Reading backed up servers from file %s", self._backup_file_path)
-
-                    # keep track of count for logging purposes (that's the only reason, I promise!)
-                    servers_count = 0
-
-                    for line in f:
-                        ip_addr, port = line.split(":")
-                        await self._add_or_update_server(RedEclipseServer(ip_addr, port, 0, "", "", "", ""))
-                        servers_count += 1
-
-                    if servers_count <= 0:
-                        self._logger.warning("Backup file contains no data, no state to restore")
-
-                    self._logger.info("Restore complete")
-
-            except OSError:
-                self._logger.warning("Backup file %s not found, cannot restore state", self._backup_file_path)
-
-            except:  # noqa: E722
-                self._logger.exception(
-                    "Failed to read backup, cannot restore state from file %s",
-                    self._backup_file_path
-                )
+            await self._restore_state()
 
         # start background tasks
         self._logger.info("Starting background tasks")
         self._running_tasks.add(self._create_task(self._poll_proxied_servers, 60))
-        self._running_tasks.add(self._create_task(self._ping_and_update_all_servers, 60))
+        self._running_tasks.add(self._create_task(self._ping_due_servers, 1))
 
         if self._backup_file_path is not None:
             self._running_tasks.add(self._create_task(self._backup_state, self._backup_interval))
 
+        for peer in self._peers.values():
+            self._running_tasks.add(self._create_peer_sync_task(peer))
+
         self._started = True
         self._stopped = False
 
@@ -152,20 +487,37 @@ class MasterServer:
         assert self._running_server is not None
 
         # cancel running tasks
-        for t in self._running_tasks:
+        # finishing tasks remove themselves from the set, therefore we need to iterate over a copy
+        for t in list(self._running_tasks):
             t.cancel()
 
         # stop server
         self._running_server.close()
         await self._running_server.wait_closed()
 
+        self._ping_service.stop()
+
+        for peer in self._peers.values():
+            await peer.close()
+
         self._started = False
         self._stopped = True
 
     @property
-    def servers(self) -> Set[RedEclipseServer]:
-        # make sure to return a copy, we don't want modifications to propagate into the database
-        return set(self._servers)
+    def servers(self) -> ServerListSnapshot:
+        # snapshots are immutable, so there's no need to copy anything
+        return self._servers.snapshot
+
+    def update_response(self) -> bytes:
+        """
+        :return: cube2 encoded response to the update command, listing all servers
+        """
+
+        # the response is cached by the snapshot
+        return self._servers.snapshot.update_response()
+
+    def servers_by_branch(self, branch: str) -> Tuple[RedEclipseServer, ...]:
+        return self._servers.by_branch(branch)
 
     def _create_task(self, callback: callable, interval: int, event_loop: asyncio.AbstractEventLoop = None):
         """
@@ -185,6 +537,8 @@ class MasterServer:
             while True:
                 try:
                     await callback(*args, **kwargs)
+                except asyncio.CancelledError:
+                    raise
                 except:  # noqa: E722
                     self._logger.exception("Error in task %s", callback.__name__)
 
@@ -192,19 +546,88 @@ class MasterServer:
 
         return event_loop.create_task(wrapper())
 
-    async def _ping_and_update_all_servers(self):
-        async def ping_task(server: RedEclipseServer) -> Tuple[RedEclipseServer, bool]:
-            """
-            Pings a server and updates some data, e.g., the serverdesc, from the reply.
+    async def _ping(self, server: RedEclipseServer) -> PingResult:
+        """
+        Pings a server. If the server is being pinged already, e.g., by a concurrent registration and the ping
+        scheduler, the result of the ping in flight is shared instead of sending a second one.
+
+        :param server: server to ping
+        :return: the server's query reply
+        :raises TimeoutError: if the server didn't reply
+        :raises PingError: if pinging failed for another reason
+        """
+
+        key = (server.ip_addr, server.port)
 
-            :param server: server to ping (and update)
-            :return: (updated) server and boolean indicating whether a reply was received (True means success)
+        try:
+            task = self._pings_in_flight[key]
+
+        except KeyError:
+            task = asyncio.get_event_loop().create_task(self._ping_once(server))
+            self._pings_in_flight[key] = task
+            task.add_done_callback(lambda _: self._pings_in_flight.pop(key, None))
+
+        else:
+            self._logger.debug("ping for server %r in flight already, waiting for its result", server)
+
+        # one of the callers being cancelled must not cancel the ping for all the others
+        return await asyncio.shield(task)
+
+    async def _ping_once(self, server: RedEclipseServer) -> PingResult:
+        """
+        Pings a server through the shared ping service. Falls back to a separate socket if the service isn't running.
+
+        The timeout and number of attempts are chosen based on the server's ping history, which is updated with the
+        result.
+
+        :param server: server to ping
+        :return: the server's query reply
+        :raises TimeoutError: if the server didn't reply
+        :raises PingError: if pinging failed for another reason
+        """
+
+        history = server.ping_history
+
+        # "info port" is always server port plus one
+        query_port = server.port + 1
+
+        if query_port > 65535:
+            raise PingError("invalid query port %d" % query_port)
+
+        try:
+            if self._ping_service.running:
+                result = await self._ping_service.ping(
+                    server.ip_addr, query_port, timeout=history.timeout, attempts=history.attempts
+                )
+
+            else:
+                result = PingResult(await ServerPinger(server.ip_addr, query_port).ping(), None, None)
+
+        except TimeoutError:
+            # a fixed number of attempts would have sent more probes
+            self._ping_stats_probes_saved += PingHistory.DEFAULT_ATTEMPTS - history.attempts
+            history.record_failure()
+            raise
+
+        except PingError:
+            history.record_failure()
+            raise
+
+        history.record_success(result.rtt, result.attempts, result.data)
+
+        return result
+
+    async def _ping_and_update_servers(self, servers: List[RedEclipseServer]):
+        async def ping_task(server: RedEclipseServer) -> Union[bytes, None]:
             """
+            Pings a server.
 
-            pinger = ServerPinger(server.ip_addr, server.port+1)
+            :param server: server to ping
+            :return: the server's query reply, or None if the server could not be reached
+            """
 
             try:
-                data = await pinger.ping()
+                return (await self._ping(server)).data
 
             except Exception as e:
                 if isinstance(e, TimeoutError):
@@ -216,106 +639,227 @@ class MasterServer:
 
                 self._logger.debug("Exception information for %r" % e, exc_info=sys.exc_info())
 
-                return server, False
+                return None
 
-            # apply the description sent by the server
-            parsed = ParsedQueryReply(data)
-            server.description = parsed.description
+        self._logger.debug("Pinging %d servers", len(servers))
 
-            return server, True
+        # run the pings and collect the results
+        # the resulting list contains the replies in the same order as the servers, or None for failed pings
+        replies = await self._ping_sweep.run(servers, ping_task)
 
-        # store tasks to be able to clean them up properly in case this task has been canceled
-        tasks = []
+        # parse all the replies in one batch in a worker thread
+        reachable = [(server, reply) for server, reply in zip(servers, replies) if reply is not None]
+        parsed = await parse_many_async(reply for _, reply in reachable)
 
-        try:
-            self._logger.info("Pinging servers")
+        # apply the descriptions sent by the servers
+        for (server, _), description in zip(reachable, parsed.descriptions):
+            if description is None:
+                self._logger.warning("Failed to parse query reply from server %r", server)
+                continue
 
-            # fetch current list of servers; no need to block any additions of servers, they'll be handled later
-            # anyway
-            async with self._lock:
-                # need to copy the value
-                servers = list(self.servers)
+            self._servers.set_description(server, description)
+
+            # entries restored from a backup are considered verified once they've replied to a ping
+            server.verified = True
 
-            # create a ping task for each
-            tasks = [ping_task(server) for server in servers]
+        # lock state and remove servers we couldn't reach
+        async with self._lock:
+            server: RedEclipseServer
+            for server, reply in zip(servers, replies):
+                if reply is not None:
+                    continue
 
-            # run the pings and collect the results
-            # the resulting list will contain (updated) server objects as well as whether the ping was successful
-            ping_results = list(await asyncio.gather(*tasks))
+                # entries of trusted master servers are removed only once the master server stops listing them
+                if self._is_trusted(server.remote_master_server):
+                    continue
 
-            # lock state and remove servers we couldn't reach
-            async with self._lock:
-                server: RedEclipseServer
-                for server, ping_successful in ping_results:
-                    # servers is a set, therefore to replace it we have to remote the old one and then add
-                    # the new instance
-                    self._logger.debug("[ping] removing %r", server.remote_master_server)
+                # the server might have been removed while it was being pinged
+                try:
                     self._servers.remove(server)
+                except KeyError:
+                    continue
+
+                self._logger.debug("[ping] removed %r", server)
+                self._ping_scheduler.unschedule(server)
+
+                # keep proxied master servers from adding the server again right away
+                self._negative_cache.record_failure(server)
+
+        self._ping_stats_pinged += len(servers)
+        self._ping_stats_unreachable += len(servers) - len(reachable)
+        self._ping_stats_players += parsed.total_players
+        self._ping_stats_modes.update(parsed.mode_distribution())
+
+    async def _ping_due_servers(self):
+        now = time.monotonic()
+
+        if now - self._ping_stats_started >= self._ping_scheduler.interval:
+            # the counters of the ping service and scheduler keep increasing, we just need the difference
+            probes_sent = self._ping_service.probes_sent - self._ping_stats_probes_sent
+            pings_skipped = self._ping_scheduler.pings_skipped - self._ping_stats_pings_skipped
+
+            # a skipped ping would have cost (at least) one probe
+            probes_saved = pings_skipped + self._ping_stats_probes_saved
+
+            pings_avoided = self._negative_cache.pings_avoided - self._ping_stats_pings_avoided
+
+            self._logger.info(
+                "Pinged %d servers in the last %d seconds, %d unreachable, %d servers listed, "
+                "%d probes sent, %d probes saved by adaptive pinging, %d pings of unreachable servers avoided",
+                self._ping_stats_pinged, now - self._ping_stats_started, self._ping_stats_unreachable,
+                len(self._servers), probes_sent, probes_saved, pings_avoided
+            )
+
+            self._logger.info(
+                "%d players reported by the servers which replied, game modes: %s",
+                self._ping_stats_players,
+                ", ".join("%d: %d" % item for item in self._ping_stats_modes.most_common()) or "none"
+            )
+
+            self._ping_stats_started = now
+            self._ping_stats_pinged = 0
+            self._ping_stats_unreachable = 0
+            self._ping_stats_probes_sent = self._ping_service.probes_sent
+            self._ping_stats_probes_saved = 0
+            self._ping_stats_pings_skipped = self._ping_scheduler.pings_skipped
+            self._ping_stats_pings_avoided = self._negative_cache.pings_avoided
+            self._ping_stats_players = 0
+            self._ping_stats_modes.clear()
+
+        servers = self._ping_scheduler.pop_due()
+
+        if not servers:
+            return
+
+        # don't wait for the pings to finish, otherwise slow pings would delay the servers due next
+        task = asyncio.get_event_loop().create_task(self._ping_and_update_servers(servers))
+        self._running_tasks.add(task)
+        task.add_done_callback(self._running_tasks.discard)
+
+    async def _restore_state(self):
+        try:
+            self._logger.info("Reading backed up servers from file %s", self._backup_file_path)
+            servers, written = await asyncio.get_event_loop().run_in_executor(None, self._state_backup.load)
+
+        except OSError:
+            self._logger.warning("Backup file %s not found, cannot restore state", self._backup_file_path)
+            return
+
+        except:  # noqa: E722
+            self._logger.exception(
+                "Failed to read backup, cannot restore state from file %s",
+                self._backup_file_path
+            )
+            return
+
+        if not servers:
+            self._logger.warning("Backup file contains no data, no state to restore")
+            return
+
+        # entries proxied from master servers which are no longer configured must not be restored
+        servers = [
+            server for server in servers
+            if server.remote_master_server is None or
+            (server.remote_master_server.host, server.remote_master_server.port) in self._proxied_master_servers
+        ]
+
+        age = time.time() - written
+
+        if self._serve_backup_max_age is not None and age <= self._serve_backup_max_age:
+            # the backup is recent enough to serve the entries right away
+            # the scheduler will ping them within the next interval, and unreachable ones are removed as usual
+            self._logger.info("Backup is %d seconds old, listing %d servers before verifying them", age, len(servers))
+
+            async with self._lock:
+                for server in servers:
+                    server.verified = False
+                    self._servers.upsert(server)
+                    self._schedule(server)
 
-                    if ping_successful:
-                        self._logger.debug("[ping] adding %r", server)
-                        self._servers.add(server)
+        else:
+            # ping the servers in parallel, but limit the number of pings in flight
+            semaphore = asyncio.Semaphore(self._ping_sweep.concurrency)
 
-            self._logger.info("Ping done")
+            async def restore(server: RedEclipseServer):
+                async with semaphore:
+                    await self._add_or_update_server(server)
 
-        except asyncio.CancelledError:
-            self._logger.info("ping and update task cancelled")
+            await asyncio.gather(*[restore(server) for server in servers])
 
-            for task in tasks:
-                task.close()
-                await task
+        self._logger.info("Restore complete, %d of %d backed up servers listed", len(self._servers), len(servers))
 
     async def _backup_state(self):
-        async with self._lock:
-            self._logger.info("Backing up state to file %s", self._backup_file_path)
+        # snapshots never change, therefore there's no need to hold the lock while writing the backup
+        snapshot = self.servers
 
-            with open(self._backup_file_path, "w") as f:
-                for server in self._servers:
-                    f.write("%s:%d\n" % (server.ip_addr.exploded, server.port))
+        if await self._state_backup.save(snapshot):
+            self._logger.info(
+                "Backed up %d servers to file %s in %.3f seconds (%d bytes)",
+                len(snapshot), self._backup_file_path, self._state_backup.last_duration,
+                self._state_backup.last_bytes_written
+            )
 
     async def _add_or_update_server(self, server: RedEclipseServer):
         async with self._lock:
             # we can update existing servers; they will be pinged automatically by a background task
-            for i, old_server in enumerate(self._servers):
-                if server == old_server:
-                    self._logger.debug("updating server %r", server)
-                    self._servers.remove(server)
-                    self._servers.add(server)
-                    break
-
-            # in case this is a new server, we need to ping it first before adding it
-            else:
-                self._logger.debug("trying to ping server %r", server)
+            old_server = self._servers.get(server)
+
+            if old_server is not None:
+                self._logger.debug("updating server %r", server)
+                server.ping_history = old_server.ping_history
+
+                # the new instance only has a placeholder description until the server is pinged again, which might
+                # take several intervals for stable servers
+                server.description = old_server.description
+                self._servers.upsert(server)
+                self._schedule(server)
+                return server
+
+        # servers which couldn't be reached recently would most likely time out again
+        if self._negative_cache.should_skip(server):
+            self._logger.warning(
+                "server %r failed to reply recently, will not be pinged for another %d seconds",
+                server, self._negative_cache.retry_in(server)
+            )
+            return
+
+        # in case this is a new server, we need to ping it first before adding it
+        # this must not hold the lock, otherwise a single dead server would block all other registrations for seconds
+        self._logger.debug("trying to ping server %r", server)
 
-                # "info port" is always server port plus one
-                # FIXME: pinging should probably not lock
-                pinger = ServerPinger(server.ip_addr, server.port + 1)
+        try:
+            data = (await self._ping(server)).data
+        except TimeoutError:
+            self._logger.warning("ping timeout for server %r, server will not be listed", server)
+            self._negative_cache.record_failure(server)
+            return
+        except PingError as e:
+            self._logger.warning("ping failed for server %r, server will not be listed: %s", server, e)
+            self._negative_cache.record_failure(server)
+            return
+
+        # apply the description sent by the server
+        try:
+            parsed = ParsedQueryReply(data, lazy=True)
+        except TruncatedQueryReplyError as e:
+            self._logger.warning("invalid reply from server %r, server will not be listed: %s", server, e)
+            self._negative_cache.record_failure(server)
+            return
 
-                try:
-                    data = await pinger.ping()
-                except TimeoutError:
-                    self._logger.warning("ping timeout for server %r, server will not be listed", server)
-                    return
-                except PingError as e:
-                    self._logger.warning("ping failed for server %r, server will not be listed: %s", server, e)
-                    return
+        self._negative_cache.record_success(server)
 
-                # apply the description sent by the server
-                parsed = ParsedQueryReply(data)
-                server.description = parsed.description
+        server.description = parsed.description
 
-                self._logger.info("ping successful, registered server %r", server)
+        async with self._lock:
+            self._logger.info("ping successful, registered server %r", server)
 
-                # make sure old server data is removed
-                try:
-                    self._servers.remove(server)
-                except KeyError:
-                    pass
+            # the server might have been added by someone else while we were pinging it, in that case we replace it
+            self._servers.upsert(server)
 
-                # if we don't remove before and just add the new server the old one is not replaced
-                self._servers.add(server)
+            # the server has just been pinged, the scheduler will take care of it from now on
+            self._schedule(server)
 
-            return server
+        return server
 
     async def register_server(self, host: str, serverip: str, port: int, branch: str):
         server = RedEclipseServer(host, port, 10, "%s:%d" % (host, port), "", "", branch)
@@ -338,7 +882,9 @@ class MasterServer:
         async with self._lock:
             try:
                 self._servers.remove(server)
-            except ValueError:
+            except KeyError:
                 return False
 
+            self._ping_scheduler.unschedule(server)
+
             return True
@@ -0,0 +1,94 @@
+import time
+from collections import OrderedDict
+from typing import Union
+
+from .red_eclipse_server import RedEclipseServer
+
+
+class _NegativeCacheEntry:
+    __slots__ = ("failures", "expires")
+
+    def __init__(self, failures: int, expires: float):
+        self.failures = failures
+        self.expires = expires
+
+
+class NegativeCache:
+    """
+    Remembers servers which could not be reached recently, so they aren't pinged over and over again when they keep
+    registering, or keep being listed by proxied master servers.
+
+    A server which failed is not verified again until its entry expires. Every consecutive failure doubles the time to
+    live, up to a maximum. Once an entry has been expired for longer than the maximum time to live, the server starts
+    over with the initial time to live.
+
+    The number of entries is bounded, the least recently failed entries are evicted first.
+    """
+
+    def __init__(self, ttl: float = 30, max_ttl: float = 1800, max_entries: int = 10000):
+        self._ttl: float = ttl
+        self._max_ttl: float = max_ttl
+        self._max_entries: int = max_entries
+
+        # entries by server key (i.e., packed address and port), in order of the last failure
+        self._entries: "OrderedDict[int, _NegativeCacheEntry]" = OrderedDict()
+
+        # statistics
+        self._pings_avoided: int = 0
+
+    @property
+    def pings_avoided(self) -> int:
+        return self._pings_avoided
+
+    def __len__(self):
+        return len(self._entries)
+
+    def retry_in(self, server: RedEclipseServer) -> Union[float, None]:
+        """
+        :return: seconds until the server may be verified again, None if it may be verified right away
+        """
+
+        entry = self._entries.get(server.key)
+
+        if entry is None:
+            return None
+
+        remaining = entry.expires - time.monotonic()
+
+        if remaining <= 0:
+            return None
+
+        return remaining
+
+    def should_skip(self, server: RedEclipseServer) -> bool:
+        """
+        Checks whether verifying a server should be skipped, and counts the avoided ping if so.
+
+        :param server: server to check
+        :return: whether the server has failed recently
+        """
+
+        if self.retry_in(server) is None:
+            return False
+
+        self._pings_avoided += 1
+        return True
+
+    def record_failure(self, server: RedEclipseServer):
+        now = time.monotonic()
+
+        entry = self._entries.pop(server.key, None)
+
+        if entry is None or now - entry.expires > self._max_ttl:
+            failures = 1
+        else:
+            failures = entry.failures + 1
+
+        ttl = min(self._max_ttl, self._ttl * 2 ** (failures - 1))
+        self._entries[server.key] = _NegativeCacheEntry(failures, now + ttl)
+
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def record_success(self, server: RedEclipseServer):
+        self._entries.pop(server.key, None)
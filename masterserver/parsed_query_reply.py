@@ -1,45 +1,90 @@
+import asyncio
 import struct
+from array import array
+from collections import Counter
+from typing import List, Iterable, Union
+
+
+class TruncatedQueryReplyError(ValueError):
+    def __init__(self, offset: int, length: int):
+        super().__init__("query reply truncated at offset %d (length: %d)" % (offset, length))
+        self.offset = offset
+        self.length = length
 
 
 class Cube2BytesStream:
+    _INT16 = struct.Struct("<h")
+    _INT32 = struct.Struct("<i")
+
     def __init__(self, data: bytes, offset: int):
-        self.data = data
+        self.reset(data, offset)
+
+    def reset(self, data: bytes, offset: int):
+        # the memoryview allows slicing strings out of the data without copying them first
+        self.data = bytes(data)
+        self._view = memoryview(self.data)
         self.offset = offset
 
     # see getint in src/shared/tools.cpp
     def next_int(self):
-        next_int = struct.unpack(b"<b", self.data[self.offset:self.offset+1])[0]
-        if next_int == -128:
-            next_int = struct.unpack("<h", self.data[self.offset+1:self.offset+3])[0]
-            self.offset += 3
-        elif next_int == -127:
-            next_int = struct.unpack("<i", self.data[self.offset+1:self.offset+5])[0]
-            self.offset += 5
-        else:
-            self.offset += 1
+        offset = self.offset
+
+        try:
+            # indexing returns an unsigned value, but the first byte is a signed char
+            next_int = self.data[offset]
+
+            if next_int == 0x80:
+                next_int = self._INT16.unpack_from(self.data, offset + 1)[0]
+                self.offset = offset + 3
+
+            elif next_int == 0x81:
+                next_int = self._INT32.unpack_from(self.data, offset + 1)[0]
+                self.offset = offset + 5
+
+            else:
+                if next_int > 0x7f:
+                    next_int -= 0x100
+
+                self.offset = offset + 1
+
+        except (IndexError, struct.error):
+            raise TruncatedQueryReplyError(offset, len(self.data))
+
         return next_int
 
     # see getstring in src/shared/tools.cpp
     def next_string(self):
-        rv = []
+        offset = self.offset
+        end = self.data.find(b"\0", offset)
+
+        # strings must be terminated by a null byte, otherwise the packet has been cut off
+        if end < 0:
+            raise TruncatedQueryReplyError(offset, len(self.data))
 
-        def getchar():
-            return struct.unpack(b"<B", self.data[self.offset:self.offset+1])[0]
+        self.offset = end + 1
 
-        char = getchar()
+        return str(self._view[offset:end], "cube2")
 
-        while char != 0 and len(self.data) > 0:
-            rv.append(bytes([char]))
-            self.offset += 1
-            char = getchar()
+    def skip_string(self):
+        end = self.data.find(b"\0", self.offset)
 
-        self.offset += 1
+        if end < 0:
+            raise TruncatedQueryReplyError(self.offset, len(self.data))
 
-        return b"".join(rv).decode("cube2")
+        self.offset = end + 1
 
 
 class ParsedQueryReply:
-    def __init__(self, query_reply: bytes):
+    """
+    Parsed representation of a server's query reply.
+
+    The integers at the beginning of the reply are cheap to parse and always read eagerly. In lazy mode, only the
+    description is decoded right away; the map name and everything following the description (version strings,
+    players, accounts) are decoded from the raw reply on first access. Truncated replies will then raise a
+    TruncatedQueryReplyError on that access rather than in the constructor.
+    """
+
+    def __init__(self, query_reply: bytes, lazy: bool = False):
         # integers inside queryreply data
         self.players_count = None
         self.number_of_ints = None
@@ -58,19 +103,63 @@ class ParsedQueryReply:
         self.time_left = None
 
         # strings inside queryreply data
-        self.map_name = None
-        self.description = None
-        self.versionbuild = None
-        self.versionbranch = None
+        self._map_name = None
+        self._description = None
+        self._versionbuild = None
+        self._versionbranch = None
 
         # players are appended to the queryresponse and thus the last part
-        self.players = None
+        self._players = None
+        self._accounts = None
+
+        # the stream is kept around to decode the remaining fields lazily
+        # the offsets point to the start of the respective field in the raw reply
+        self._stream: Cube2BytesStream = None
+        self._map_name_offset: int = None
+        self._tail_offset: int = None
+        self._tail_parsed: bool = False
 
         self._parse_query_reply(query_reply)
 
+        if not lazy:
+            self._parse_tail()
+
+    @property
+    def map_name(self) -> str:
+        if self._map_name is None:
+            self._stream.offset = self._map_name_offset
+            self._map_name = self._stream.next_string()
+
+        return self._map_name
+
+    @property
+    def description(self) -> str:
+        return self._description
+
+    @property
+    def versionbuild(self) -> str:
+        self._parse_tail()
+        return self._versionbuild
+
+    @property
+    def versionbranch(self) -> str:
+        self._parse_tail()
+        return self._versionbranch
+
+    @property
+    def players(self):
+        self._parse_tail()
+        return self._players
+
+    @property
+    def accounts(self):
+        self._parse_tail()
+        return self._accounts
+
     def _parse_query_reply(self, query_reply: bytes):
         # Skip first 5 bytes as they are equal to the bytes sent as request
         stream = Cube2BytesStream(query_reply, 5)
+        self._stream = stream
 
         self.players_count = stream.next_int()
 
@@ -105,29 +194,156 @@ class ParsedQueryReply:
             # throw away value
             stream.next_int()
 
-        self.map_name = stream.next_string()
+        # the map name is only decoded when it's needed
+        self._map_name_offset = stream.offset
+        stream.skip_string()
+
+        # limit server description to 80 chars
+        # https://github.com/red-eclipse/base/compare/0512024fef0f...01f6afe516d8
+        self._description = stream.next_string()[:80]
+
+        # fast path: everything the masterserver needs has been parsed, the rest can wait
+        self._tail_offset = stream.offset
+
+    def _parse_tail(self):
+        if self._tail_parsed:
+            return
 
-        self.description = stream.next_string()
+        stream = self._stream
+        stream.offset = self._tail_offset
 
         if self.version[0] >= 1:
             # support for a "versionbuild" has been added in 1.6.0
             if self.version[1] >= 6:
-                self.versionbuild = stream.next_string()
+                self._versionbuild = stream.next_string()
 
             # from 1.5.5 on, the server sends a versionbranch string which has to
             # be parsed
             if self.version[1] >= 5 and self.version[2] > 3:
                 try:
-                    self.versionbranch = stream.next_string()
-                except struct.error:
+                    self._versionbranch = stream.next_string()
+                except TruncatedQueryReplyError:
                     # some servers send an invalid version branch string
                     # since it isn't used anywhere (yet), we'll just ignore
                     # the error
                     pass
 
-        self.players = [stream.next_string() for i in range(self.players_count)]
-        self.accounts = [stream.next_string().strip() for i in range(len(self.players))]
+        self._players = [stream.next_string() for i in range(self.players_count)]
+        self._accounts = [stream.next_string().strip() for i in range(len(self._players))]
 
-        # limit server description to 80 chars
-        # https://github.com/red-eclipse/base/compare/0512024fef0f...01f6afe516d8
-        self.description = self.description[:80]
+        self._tail_parsed = True
+
+
+class ParsedQueryReplies:
+    """
+    Columnar parse results for a batch of query replies, as returned by parse_many().
+
+    Index i of every column belongs to the i-th reply passed to parse_many(). Replies which could not be parsed have
+    -1 in all numeric columns and None as description.
+    """
+
+    def __init__(self):
+        self.players_count = array("i")
+        self.max_slots = array("i")
+        self.game_mode = array("i")
+        self.mutators = array("i")
+        self.version_major = array("i")
+        self.version_minor = array("i")
+        self.version_patch = array("i")
+        self.descriptions: List[Union[str, None]] = []
+
+    def __len__(self):
+        return len(self.descriptions)
+
+    @property
+    def errors_count(self) -> int:
+        return self.descriptions.count(None)
+
+    @property
+    def total_players(self) -> int:
+        # skip the placeholders of replies which couldn't be parsed
+        return sum(i for i in self.players_count if i > 0)
+
+    def mode_distribution(self) -> Counter:
+        distribution = Counter(self.game_mode)
+        distribution.pop(-1, None)
+        return distribution
+
+
+def parse_many(replies: Iterable[bytes]) -> ParsedQueryReplies:
+    """
+    Parses the header and description of many query replies in one go, e.g., all replies collected by a ping sweep.
+
+    Unlike ParsedQueryReply, this does not create any objects per reply. The results are stored in flat arrays, which
+    makes computing aggregate statistics cheap.
+
+    :param replies: raw query replies
+    :return: columnar results
+    """
+
+    rv = ParsedQueryReplies()
+
+    # a single stream is reused for all the replies
+    stream = Cube2BytesStream(b"", 0)
+
+    for reply in replies:
+        try:
+            # Skip first 5 bytes as they are equal to the bytes sent as request
+            stream.reset(reply, 5)
+
+            players_count = stream.next_int()
+            number_of_ints = stream.next_int()
+
+            # protocol
+            stream.next_int()
+
+            game_mode = stream.next_int()
+            mutators = stream.next_int()
+
+            # time remaining
+            stream.next_int()
+
+            max_slots = stream.next_int()
+
+            # mastermode, modification percentage, number of game vars
+            for i in range(3):
+                stream.next_int()
+
+            version = (stream.next_int(), stream.next_int(), stream.next_int())
+
+            # see ParsedQueryReply: 11 of the (at least) 15 ints following number_of_ints have been read so far
+            for i in range(11, max(15, number_of_ints)):
+                stream.next_int()
+
+            # map name
+            stream.skip_string()
+
+            # limit server description to 80 chars, see ParsedQueryReply
+            description = stream.next_string()[:80]
+
+        except TruncatedQueryReplyError:
+            players_count = max_slots = game_mode = mutators = -1
+            version = (-1, -1, -1)
+            description = None
+
+        rv.players_count.append(players_count)
+        rv.max_slots.append(max_slots)
+        rv.game_mode.append(game_mode)
+        rv.mutators.append(mutators)
+        rv.version_major.append(version[0])
+        rv.version_minor.append(version[1])
+        rv.version_patch.append(version[2])
+        rv.descriptions.append(description)
+
+    return rv
+
+
+async def parse_many_async(replies: Iterable[bytes]) -> ParsedQueryReplies:
+    """
+    Runs parse_many() in the event loop's default executor so that large batches don't block the event loop.
+    """
+
+    # the replies might be consumed lazily by the worker thread, therefore we need to make sure they can't change
+    replies = list(replies)
+
+    return await asyncio.get_event_loop().run_in_executor(None, parse_many, replies)
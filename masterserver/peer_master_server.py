@@ -0,0 +1,169 @@
+import asyncio
+from asyncio import StreamReader, StreamWriter
+from collections import namedtuple
+from typing import Union
+
+from . import get_logger
+from .circuit_breaker import CircuitBreaker
+from .red_eclipse_server import RedEclipseServer
+from .remote_master_server import RemoteMasterServer
+from .server_list_parser import ServerListParser
+
+
+# result of PeerMasterServer.sync()
+# reset: whether the peer sent its complete list, which replaces everything received from it before
+# changes: PeerChange objects in the order they have been made, must be applied in this order
+PeerUpdate = namedtuple("PeerUpdate", ["reset", "changes"])
+
+# server: server which has been added or updated, or removed
+# removed: whether the server has been removed
+PeerChange = namedtuple("PeerChange", ["server", "removed"])
+
+
+class PeerMasterServer(RemoteMasterServer):
+    """
+    Another instance of this master server, which we exchange registrations with.
+
+    Unlike proxied master servers, peers are not polled for their complete list. Instead, we keep a connection open and
+    request the changes since the last sync with the peersync command. The peer answers as soon as there are changes
+    (or after a while if there are none), sending only the servers which have registered with it, or which have been
+    removed since. Only if the peer cannot send the changes, e.g., because it has been restarted in the meantime or we
+    have fallen behind too far, it sends its complete list instead.
+
+    Protocol:
+
+        > peersync <epoch> <seq>
+        < peerdelta <epoch> <seq>        (or: peerreset <epoch> <seq>)
+        < addserver <ip> <port> <priority> "<description>" "<handle>" "<role>" "<branch>"
+        < delserver <ip> <port>
+        < peerend
+
+    The epoch identifies the peer's change log, and seq is the sequence number of the last change sent. On the first
+    sync, both are unknown, which is signaled by an epoch of "-".
+    """
+
+    _logger = get_logger("peer-master-server")
+
+    def __init__(self, host: str, port: int = None):
+        super().__init__(host, port)
+
+        self._epoch: Union[str, None] = None
+        self._seq: int = 0
+
+        self._reader: Union[StreamReader, None] = None
+        self._writer: Union[StreamWriter, None] = None
+
+        self._circuit_breaker: CircuitBreaker = CircuitBreaker(failure_threshold=3, backoff=5, max_backoff=300)
+
+    def __repr__(self):
+        return "<PeerMasterServer %s:%d>" % (self.host, self.port)
+
+    @property
+    def epoch(self) -> Union[str, None]:
+        return self._epoch
+
+    @property
+    def seq(self) -> int:
+        return self._seq
+
+    @property
+    def circuit_breaker(self) -> CircuitBreaker:
+        return self._circuit_breaker
+
+    def forget(self):
+        """
+        Forgets the state of the last sync, so the next sync requests the complete list.
+        """
+
+        self._epoch = None
+        self._seq = 0
+
+    async def close(self):
+        if self._writer is None:
+            return
+
+        writer = self._writer
+        self._reader = self._writer = None
+
+        writer.close()
+
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+
+    async def sync(self, connect_timeout: float = None, read_timeout: float = None) -> PeerUpdate:
+        """
+        Requests the changes since the last sync. Waits until the peer has sent them, which might take a while if
+        there are no changes.
+
+        :param connect_timeout: seconds to wait for the connection to be established, None waits indefinitely
+        :param read_timeout: seconds to wait for the complete reply, None waits indefinitely
+        :return: changes
+        :raises asyncio.TimeoutError: if either timeout is exceeded
+        :raises OSError: on connection errors
+        :raises ValueError: if the peer sent an invalid reply
+        """
+
+        if self._writer is None:
+            self._reader, self._writer = await self.connect(connect_timeout)
+
+        try:
+            update, epoch, seq = await asyncio.wait_for(self._request_changes(), read_timeout)
+
+        except BaseException:
+            # the connection is in an undefined state, the next sync will reconnect
+            # since we keep the last epoch and seq, we don't need a full resync, though
+            await self.close()
+            raise
+
+        self._epoch = epoch
+        self._seq = seq
+
+        return update
+
+    async def _request_changes(self):
+        self._writer.write(("peersync %s %d\n" % (self._epoch or "-", self._seq)).encode())
+        await self._writer.drain()
+
+        header = (await self._reader.readline()).decode().split()
+
+        if len(header) != 3 or header[0] not in ("peerdelta", "peerreset"):
+            raise ValueError("Invalid peersync response", header)
+
+        kind, epoch, seq = header
+
+        parser = ServerListParser(self)
+
+        changes = []
+
+        while True:
+            line = await self._reader.readline()
+
+            if not line:
+                raise ConnectionResetError("Connection closed by peer")
+
+            if line == b"peerend\n":
+                break
+
+            if line.startswith(b"delserver "):
+                try:
+                    _, ip_addr, port = line.decode().split()
+                    server = RedEclipseServer(ip_addr, int(port))
+                except ValueError:
+                    self._logger.exception("Failed to parse delserver line")
+                    continue
+
+                changes.append(PeerChange(server, True))
+                continue
+
+            try:
+                server = parser.parse_line(line)
+            except ValueError:
+                self._logger.exception("Failed to parse addserver line")
+                continue
+
+            if server is not None:
+                changes.append(PeerChange(server, False))
+
+        return PeerUpdate(kind == "peerreset", changes), epoch, int(seq)
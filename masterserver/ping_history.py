@@ -0,0 +1,126 @@
+import time
+from typing import Union
+
+
+class PingHistory:
+    """
+    Ping statistics of a single server, used to adapt how often and how patiently the server is pinged.
+
+    The round trip time is smoothed like TCP does it (see RFC 6298). Servers which have answered the first probe of many
+    pings in a row are considered stable; they are pinged less often and with fewer attempts.
+    """
+
+    __slots__ = ("_srtt", "_rttvar", "_streak", "_successes", "_failures", "_last_success", "_last_reply")
+
+    # default values, used as long as nothing is known about a server; see ServerPinger
+    DEFAULT_TIMEOUT = 1.0
+    DEFAULT_ATTEMPTS = 5
+
+    MIN_TIMEOUT = 0.25
+
+    # a server is considered stable after it answered this many pings in a row on the first attempt
+    STABLE_STREAK = 10
+    STABLE_ATTEMPTS = 3
+
+    # the ping interval is doubled every STABLE_STREAK pings, up to this factor
+    MAX_INTERVAL_MULTIPLIER = 4
+
+    def __init__(self):
+        self._srtt: Union[float, None] = None
+        self._rttvar: Union[float, None] = None
+
+        # number of consecutive pings answered on the first attempt
+        self._streak: int = 0
+
+        self._successes: int = 0
+        self._failures: int = 0
+
+        # wall clock time, so it can be stored in backups
+        self._last_success: Union[float, None] = None
+
+        # raw query reply received on the last successful ping
+        self._last_reply: Union[bytes, None] = None
+
+    @property
+    def srtt(self) -> Union[float, None]:
+        return self._srtt
+
+    @property
+    def successes(self) -> int:
+        return self._successes
+
+    @property
+    def failures(self) -> int:
+        return self._failures
+
+    @property
+    def last_success(self) -> Union[float, None]:
+        return self._last_success
+
+    @property
+    def last_reply(self) -> Union[bytes, None]:
+        return self._last_reply
+
+    @property
+    def stable(self) -> bool:
+        return self._streak >= self.STABLE_STREAK
+
+    @property
+    def timeout(self) -> float:
+        if self._srtt is None:
+            return self.DEFAULT_TIMEOUT
+
+        return min(self.DEFAULT_TIMEOUT, max(self.MIN_TIMEOUT, self._srtt + 4 * self._rttvar))
+
+    @property
+    def attempts(self) -> int:
+        if self.stable:
+            return self.STABLE_ATTEMPTS
+
+        return self.DEFAULT_ATTEMPTS
+
+    @property
+    def interval_multiplier(self) -> int:
+        return min(self.MAX_INTERVAL_MULTIPLIER, 2 ** (self._streak // self.STABLE_STREAK))
+
+    def record_success(self, rtt: Union[float, None], attempts: int = 1, reply: bytes = None):
+        """
+        :param rtt: measured round trip time, or None if it couldn't be measured reliably
+        :param attempts: number of probes sent before a reply arrived
+        :param reply: query reply received
+        """
+
+        self._successes += 1
+        self._last_success = time.time()
+        self._last_reply = reply
+
+        if attempts > 1:
+            self._streak = 0
+        else:
+            self._streak += 1
+
+        if rtt is not None:
+            if self._srtt is None:
+                self._srtt = rtt
+                self._rttvar = rtt / 2
+
+            else:
+                self._rttvar = 0.75 * self._rttvar + 0.25 * abs(self._srtt - rtt)
+                self._srtt = 0.875 * self._srtt + 0.125 * rtt
+
+    def record_failure(self):
+        self._failures += 1
+        self._streak = 0
+
+    def restore(self, srtt: Union[float, None], last_success: Union[float, None], last_reply: Union[bytes, None]):
+        """
+        Restores the state saved in a backup. The RTT variance is unknown, so it is initialized like for a first
+        measurement.
+        """
+
+        if srtt is not None:
+            self._srtt = srtt
+            self._rttvar = srtt / 2
+
+        self._last_success = last_success
+        self._last_reply = last_reply
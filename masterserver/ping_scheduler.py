@@ -0,0 +1,133 @@
+import heapq
+import itertools
+import time
+from typing import Dict, List, Tuple
+
+from .red_eclipse_server import RedEclipseServer
+
+
+class _ScheduleEntry:
+    def __init__(self, server: RedEclipseServer, slot: int, due: float, interval_multiplier: int):
+        self.server = server
+        self.slot = slot
+        self.due = due
+        self.interval_multiplier = interval_multiplier
+
+
+class PingScheduler:
+    """
+    Keeps track of when every server is due to be pinged next.
+
+    The ping interval is divided into a number of slots. Each server is assigned to the least busy slot when it is
+    scheduled for the first time, and is then pinged once per interval at its slot's time. This way, the pings are
+    spread evenly across the interval, and the load stays constant instead of spiking once per interval.
+
+    Stable servers are pinged only every n-th interval, as suggested by their ping history. Additionally, servers can be
+    scheduled to be pinged less often in general.
+    """
+
+    def __init__(self, interval: float = 60, slots_count: int = 60):
+        self._interval: float = interval
+        self._slots_count: int = slots_count
+        self._slot_width: float = interval / slots_count
+
+        # all slot times are relative to this point in time
+        self._epoch: float = time.monotonic()
+
+        # number of servers assigned to each slot
+        self._slot_loads: List[int] = [0] * slots_count
+
+        self._entries: Dict[RedEclipseServer, _ScheduleEntry] = {}
+
+        # heap of (due time, sequence number, entry)
+        # entries are not removed from the heap when a server is unscheduled, instead they're skipped when they don't
+        # belong to the schedule any more, or their due time has changed
+        # the sequence number avoids comparing entries when two due times are equal
+        self._heap: List[Tuple[float, int, _ScheduleEntry]] = []
+        self._counter = itertools.count()
+
+        # total number of pings skipped because servers are pinged less often than once per interval
+        self._pings_skipped: int = 0
+
+    @property
+    def interval(self):
+        return self._interval
+
+    @property
+    def pings_skipped(self) -> int:
+        return self._pings_skipped
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, server: RedEclipseServer):
+        return server in self._entries
+
+    def _next_slot_time(self, slot: int, now: float) -> float:
+        # first occurrence of the slot after now
+        offset = self._epoch + slot * self._slot_width
+        periods = (now - offset) // self._interval + 1
+        return offset + periods * self._interval
+
+    def _push(self, entry: _ScheduleEntry):
+        heapq.heappush(self._heap, (entry.due, next(self._counter), entry))
+
+    def schedule(self, server: RedEclipseServer, interval_multiplier: int = 1):
+        """
+        Adds a server to the schedule. If the server is scheduled already, it keeps its due time, but the scheduler
+        will return the passed instance from now on, since updating servers replaces their instances.
+
+        :param server: server to schedule
+        :param interval_multiplier: ping the server only every n-th interval
+        """
+
+        try:
+            entry = self._entries[server]
+
+        except KeyError:
+            slot = self._slot_loads.index(min(self._slot_loads))
+            self._slot_loads[slot] += 1
+
+            entry = _ScheduleEntry(server, slot, self._next_slot_time(slot, time.monotonic()), interval_multiplier)
+            self._entries[server] = entry
+            self._push(entry)
+
+        else:
+            entry.server = server
+            entry.interval_multiplier = interval_multiplier
+
+    def unschedule(self, server: RedEclipseServer):
+        try:
+            entry = self._entries.pop(server)
+        except KeyError:
+            return
+
+        self._slot_loads[entry.slot] -= 1
+
+    def pop_due(self) -> List[RedEclipseServer]:
+        """
+        Returns all servers which are due to be pinged, and schedules them for their next ping one interval later.
+
+        :return: servers to ping now
+        """
+
+        now = time.monotonic()
+
+        rv = []
+
+        while self._heap and self._heap[0][0] <= now:
+            due, _, entry = heapq.heappop(self._heap)
+
+            # skip stale heap entries
+            if self._entries.get(entry.server) is not entry or entry.due != due:
+                continue
+
+            rv.append(entry.server)
+
+            # stick to the slot, even if we're late
+            multiplier = entry.interval_multiplier * entry.server.ping_history.interval_multiplier
+            entry.due = self._next_slot_time(entry.slot, now) + (multiplier - 1) * self._interval
+            self._pings_skipped += multiplier - 1
+            self._push(entry)
+
+        return rv
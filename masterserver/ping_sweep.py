@@ -0,0 +1,93 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Iterable, List, Union
+
+from . import get_logger
+from .red_eclipse_server import RedEclipseServer
+
+
+class PingSweep:
+    """
+    Pings lists of servers with a bounded number of concurrent pings, and reports the progress while doing so.
+
+    The concurrency limit is shared by all runs, so it also applies if multiple runs overlap.
+
+    The actual pinging is done by a callback, which is expected to handle errors itself and return None for servers
+    which could not be reached.
+    """
+
+    _logger = get_logger("ping_sweep")
+
+    def __init__(self, concurrency: int = 100, progress_interval: float = 10):
+        self._concurrency: int = concurrency
+        self._progress_interval: float = progress_interval
+
+        # created on first use to make sure it is bound to the running event loop
+        self._semaphore: Union[asyncio.Semaphore, None] = None
+
+        # statistics of the last completed sweep
+        self._last_duration: Union[float, None] = None
+        self._last_servers_count: int = 0
+
+    @property
+    def concurrency(self):
+        return self._concurrency
+
+    @property
+    def last_duration(self) -> Union[float, None]:
+        return self._last_duration
+
+    @property
+    def last_servers_count(self) -> int:
+        return self._last_servers_count
+
+    async def run(
+        self,
+        servers: Iterable[RedEclipseServer],
+        ping: Callable[[RedEclipseServer], Awaitable[Union[bytes, None]]]
+    ) -> List[Union[bytes, None]]:
+        """
+        Pings all servers.
+
+        :param servers: servers to ping
+        :param ping: callback which pings a single server
+        :return: replies in the same order as the servers, None for servers which could not be reached
+        """
+
+        # a fixed number of workers take the servers one by one, so there's no need to create a task per server
+        servers = list(servers)
+        replies: List[Union[bytes, None]] = [None] * len(servers)
+
+        indices = iter(range(len(servers)))
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._concurrency)
+
+        started = time.monotonic()
+        last_report = started
+        done = 0
+
+        async def worker():
+            nonlocal done, last_report
+
+            for i in indices:
+                async with self._semaphore:
+                    replies[i] = await ping(servers[i])
+
+                done += 1
+
+                now = time.monotonic()
+
+                if now - last_report >= self._progress_interval:
+                    self._logger.info("Sweep progress: %d of %d servers pinged", done, len(servers))
+                    last_report = now
+
+        workers_count = min(self._concurrency, len(servers))
+        await asyncio.gather(*[worker() for _ in range(workers_count)])
+
+        self._last_duration = time.monotonic() - started
+        self._last_servers_count = len(servers)
+
+        self._logger.debug("Sweep of %d servers took %.2f seconds", len(servers), self._last_duration)
+
+        return replies
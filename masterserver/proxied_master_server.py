@@ -0,0 +1,138 @@
+import asyncio
+import time
+from typing import List, Union
+
+from . import get_logger
+from .circuit_breaker import CircuitBreaker
+from .red_eclipse_server import RedEclipseServer
+from .remote_master_server import RemoteMasterServer
+
+
+class ProxiedMasterServer:
+    """
+    Polls the server list of a proxied master server.
+
+    Every poll is bounded by a connect and a read timeout, so a hung master server cannot stall the polling. A master
+    server which keeps failing is not contacted again until its circuit breaker permits a new attempt. Statistics
+    about the polls are collected for monitoring.
+
+    The entries of trusted master servers are listed on the master server's authority, i.e., they are not verified
+    before they are listed, and are only removed once the master server stops listing them.
+    """
+
+    _logger = get_logger("proxied-master-server")
+
+    def __init__(self, remote_master_server: RemoteMasterServer, connect_timeout: float = 5, read_timeout: float = 10,
+                 circuit_breaker: CircuitBreaker = None, trusted: bool = False):
+        if circuit_breaker is None:
+            circuit_breaker = CircuitBreaker()
+
+        self._remote_master_server: RemoteMasterServer = remote_master_server
+        self._connect_timeout: float = connect_timeout
+        self._read_timeout: float = read_timeout
+        self._circuit_breaker: CircuitBreaker = circuit_breaker
+        self._trusted: bool = trusted
+
+        # statistics
+        self._polls: int = 0
+        self._failures: int = 0
+        self._skipped: int = 0
+        self._last_latency: Union[float, None] = None
+        self._last_entries_count: Union[int, None] = None
+        self._last_error: Union[str, None] = None
+
+    @property
+    def remote_master_server(self) -> RemoteMasterServer:
+        return self._remote_master_server
+
+    @property
+    def circuit_breaker(self) -> CircuitBreaker:
+        return self._circuit_breaker
+
+    @property
+    def trusted(self) -> bool:
+        return self._trusted
+
+    @property
+    def polls(self) -> int:
+        return self._polls
+
+    @property
+    def failures(self) -> int:
+        return self._failures
+
+    @property
+    def skipped(self) -> int:
+        return self._skipped
+
+    @property
+    def last_latency(self) -> Union[float, None]:
+        return self._last_latency
+
+    @property
+    def last_entries_count(self) -> Union[int, None]:
+        return self._last_entries_count
+
+    @property
+    def last_error(self) -> Union[str, None]:
+        return self._last_error
+
+    def __repr__(self):
+        return "<ProxiedMasterServer %s:%d>" % (self._remote_master_server.host, self._remote_master_server.port)
+
+    async def poll(self) -> Union[List[RedEclipseServer], None]:
+        """
+        Fetches the server list. Never raises, errors are logged and counted instead.
+
+        :return: the servers listed, or None if the list could not be fetched or the circuit breaker is open
+        """
+
+        if not self._circuit_breaker.allow():
+            self._skipped += 1
+            self._logger.debug("Not polling %r, circuit breaker open for another %d seconds",
+                               self, self._circuit_breaker.retry_in)
+            return None
+
+        self._polls += 1
+        started = time.monotonic()
+
+        try:
+            servers = await self._remote_master_server.list_servers(self._connect_timeout, self._read_timeout)
+
+        except asyncio.CancelledError:
+            raise
+
+        except Exception as e:
+            self._failures += 1
+            self._last_error = repr(e)
+            self._circuit_breaker.record_failure()
+
+            self._logger.warning(
+                "Failed to poll %r (%d consecutive failures): %r", self, self._circuit_breaker.consecutive_failures, e
+            )
+
+            return None
+
+        self._last_latency = time.monotonic() - started
+        self._last_entries_count = len(servers)
+        self._last_error = None
+        self._circuit_breaker.record_success()
+
+        self._logger.debug("Polled %r in %.3f seconds, %d servers listed", self, self._last_latency, len(servers))
+
+        return servers
+
+    def to_json_dict(self) -> dict:
+        return {
+            "host": self._remote_master_server.host,
+            "port": self._remote_master_server.port,
+            "trusted": self._trusted,
+            "polls": self._polls,
+            "failures": self._failures,
+            "skipped": self._skipped,
+            "consecutive_failures": self._circuit_breaker.consecutive_failures,
+            "circuit_open": self._circuit_breaker.is_open,
+            "last_latency": self._last_latency,
+            "last_entries_count": self._last_entries_count,
+            "last_error": self._last_error,
+        }
@@ -0,0 +1,95 @@
+from collections import OrderedDict
+from ipaddress import ip_network
+from typing import Dict, Tuple
+
+from .token_bucket import TokenBucket
+
+
+class RateLimiter:
+    """
+    Limits the rate of commands per source IP address and per subnet.
+
+    Every class of commands has its own budget, given as rate (commands per second) and burst capacity per IP address.
+    Subnets (/24 for IPv4, /64 for IPv6) get a multiple of that budget, so an attacker cannot circumvent the limits by
+    using many addresses of the same network, but a few clients behind the same network are not affected.
+
+    The token buckets are stored in a table of bounded size. Once it's full, the least recently used buckets are
+    evicted, so the memory usage stays flat even if a flood comes from a lot of different addresses.
+    """
+
+    # commands per second and burst capacity per IP address
+    DEFAULT_BUDGETS = {
+        "update": (1, 10),
+        # hosts often start many game servers at once, all of which register from the same address
+        "server": (0.1, 50),
+        "auth": (5, 20),
+        # peers sync again right after every change
+        "peer": (10, 50),
+    }
+
+    def __init__(self, budgets: Dict[str, Tuple[float, float]] = None, subnet_factor: float = 4,
+                 max_entries: int = 10000):
+        # command classes which aren't given use the default budgets
+        self._budgets: Dict[str, Tuple[float, float]] = dict(self.DEFAULT_BUDGETS)
+
+        if budgets is not None:
+            self._budgets.update(budgets)
+        self._subnet_factor: float = subnet_factor
+        self._max_entries: int = max_entries
+
+        # (command class, address or network) -> bucket, in order of last use
+        self._buckets: "OrderedDict[Tuple[str, str], TokenBucket]" = OrderedDict()
+
+        # number of commands rejected by command class
+        self._limited: Dict[str, int] = {command_class: 0 for command_class in self._budgets}
+
+    @property
+    def limited(self) -> Dict[str, int]:
+        return dict(self._limited)
+
+    def __len__(self):
+        return len(self._buckets)
+
+    @staticmethod
+    def _subnet(ip_addr: str) -> str:
+        prefix = 64 if ":" in ip_addr else 24
+        return str(ip_network("%s/%d" % (ip_addr, prefix), strict=False))
+
+    def _bucket(self, command_class: str, key: str, factor: float) -> TokenBucket:
+        try:
+            bucket = self._buckets[(command_class, key)]
+
+        except KeyError:
+            rate, capacity = self._budgets[command_class]
+            bucket = TokenBucket(rate * factor, capacity * factor)
+
+            self._buckets[(command_class, key)] = bucket
+
+            while len(self._buckets) > self._max_entries:
+                self._buckets.popitem(last=False)
+
+        else:
+            self._buckets.move_to_end((command_class, key))
+
+        return bucket
+
+    def try_acquire(self, command_class: str, ip_addr: str) -> bool:
+        """
+        :param command_class: class of the command, one of the keys of the budgets
+        :param ip_addr: address the command has been sent from
+        :return: whether the command may be handled
+        :raises KeyError: if there is no budget for the command class
+        """
+
+        if command_class not in self._budgets:
+            raise KeyError(command_class)
+
+        allowed = (
+            self._bucket(command_class, self._subnet(ip_addr), self._subnet_factor).try_consume()
+            and self._bucket(command_class, ip_addr, 1).try_consume()
+        )
+
+        if not allowed:
+            self._limited[command_class] += 1
+
+        return allowed
@@ -2,6 +2,8 @@ from ipaddress import IPv4Address
 
 import typing
 
+from .ping_history import PingHistory
+
 if typing.TYPE_CHECKING:
     from .remote_master_server import RemoteMasterServer
 
@@ -9,13 +11,26 @@ if typing.TYPE_CHECKING:
 class RedEclipseServer:
     """
     Red Eclipse Server representation
+
+    Master servers keep a lot of these around, therefore the class uses slots and stores the IP address as an integer.
+    The hash as well as the rendered addserver line and JSON dict are computed once and cached until a field changes.
     """
 
+    __slots__ = (
+        "_ip", "_port", "_priority", "_description", "_auth_handle", "_role", "_branch", "_remote_master_server",
+        "_ping_history", "_verified", "_hash", "_addserver_line", "_json_dict",
+    )
+
     def __init__(self, ip_addr: str, port: int,
                  priority: int = 0, description: str = None, handle: str = None, role: str = None, branch: str = None,
                  remote_master_server: "RemoteMasterServer" = None):
-        self._ip_addr: IPv4Address = IPv4Address(ip_addr)
+        self._ip: int = int(IPv4Address(ip_addr))
         self._port: int = int(port)
+
+        # the key only identifies the server if the port fits into 16 bits
+        if not 0 <= self._port <= 65535:
+            raise ValueError("invalid port %d" % self._port)
+
         self._priority: int = int(priority)
         self._description: str = description
         self._auth_handle: str = handle
@@ -23,24 +38,47 @@ class RedEclipseServer:
         self._branch: str = branch
         self._remote_master_server: RemoteMasterServer = remote_master_server
 
+        # created on first use to keep entries small until they're pinged
+        self._ping_history: typing.Union[PingHistory, None] = None
+
+        # entries restored from a backup may be listed before they have been pinged
+        self._verified: bool = True
+
+        self._hash: int = hash(self.key)
+        self._invalidate()
+
+    def _invalidate(self):
+        self._addserver_line: typing.Union[str, None] = None
+        self._json_dict: typing.Union[dict, None] = None
+
     @property
     def ip_addr(self):
-        return IPv4Address(self._ip_addr)
+        return IPv4Address(self._ip)
 
     @ip_addr.setter
     def ip_addr(self, new_addr: IPv4Address):
-        if not self._ip_addr.is_private:
+        if not IPv4Address(self._ip).is_private:
             raise ValueError("IP address may only be replaced if it's private")
 
         if new_addr.is_private:
             raise ValueError("IP address may only be overwritten by a non-private one")
 
-        self._ip_addr = new_addr
+        self._ip = int(new_addr)
+        self._hash = hash(self.key)
+        self._invalidate()
 
     @property
     def port(self):
         return self._port
 
+    @property
+    def key(self) -> int:
+        """
+        Compact identifier of the server's address, e.g., for use as a dict key.
+        """
+
+        return self._ip << 16 | self._port
+
     @property
     def priority(self):
         return self._priority
@@ -55,7 +93,9 @@ class RedEclipseServer:
 
     @description.setter
     def description(self, value):
-        self._description = value
+        if value != self._description:
+            self._description = value
+            self._invalidate()
 
     @property
     def auth_handle(self):
@@ -73,39 +113,78 @@ class RedEclipseServer:
     def remote_master_server(self):
         return self._remote_master_server
 
+    @property
+    def ping_history(self):
+        if self._ping_history is None:
+            self._ping_history = PingHistory()
+
+        return self._ping_history
+
+    @property
+    def existing_ping_history(self) -> typing.Union[PingHistory, None]:
+        """
+        The ping history, or None if it hasn't been needed so far. Unlike ping_history, doesn't create one.
+        """
+
+        return self._ping_history
+
+    @ping_history.setter
+    def ping_history(self, value: PingHistory):
+        # needed to carry the history over when a server entry is replaced by an updated instance
+        self._ping_history = value
+
+    @property
+    def verified(self):
+        return self._verified
+
+    @verified.setter
+    def verified(self, value: bool):
+        self._verified = value
+        self._json_dict = None
+
     def addserver_line(self):
-        return '%s %d %d "%s" "%s" "%s" "%s"' % (
-            self.ip_addr,
-            self.port,
-            self.priority,
-            self.description,
-            self.auth_handle,
-            self.role,
-            self.branch
-        )
+        if self._addserver_line is None:
+            self._addserver_line = '%s %d %d "%s" "%s" "%s" "%s"' % (
+                self.ip_addr,
+                self.port,
+                self.priority,
+                self.description,
+                self.auth_handle,
+                self.role,
+                self.branch
+            )
+
+        return self._addserver_line
 
     def __repr__(self):
         return "<RedEclipseServer %s>" % self.addserver_line()
 
     def __eq__(self, other: "RedEclipseServer"):
-        return self.ip_addr == other.ip_addr and self.port == other.port
+        return self._ip == other._ip and self._port == other._port
 
     def __hash__(self):
-        return hash((self.ip_addr, self.port))
+        return self._hash
 
     def to_json_dict(self) -> dict:
-        rv = {
-            "ip_addr": self.ip_addr.exploded,
-            "port": self.port,
-            "priority": self.priority,
-            "description": self.description,
-            "auth_handle": self.auth_handle,
-            "role": self.role,
-            "branch": self.branch,
-            "remote_master_server": None,
-        }
-
-        if self.remote_master_server is not None:
-            rv["remote_master_server"] = "%s:%d" % (self.remote_master_server.host, self.remote_master_server.port)
-
-        return rv
+        if self._json_dict is None:
+            rv = {
+                "ip_addr": self.ip_addr.exploded,
+                "port": self.port,
+                "priority": self.priority,
+                "description": self.description,
+                "auth_handle": self.auth_handle,
+                "role": self.role,
+                "branch": self.branch,
+                "remote_master_server": None,
+                "verified": self.verified,
+            }
+
+            if self.remote_master_server is not None:
+                rv["remote_master_server"] = "%s:%d" % (
+                    self.remote_master_server.host, self.remote_master_server.port
+                )
+
+            self._json_dict = rv
+
+        # return a copy, the cached dict must not be modified by the caller
+        return dict(self._json_dict)
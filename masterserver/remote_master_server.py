@@ -1,7 +1,9 @@
 import asyncio
 from asyncio import StreamReader, StreamWriter
+from typing import AsyncIterator, List
 
 from . import get_logger
+from .red_eclipse_server import RedEclipseServer
 from .server_list_parser import ServerListParser
 
 
@@ -26,22 +28,56 @@ class RemoteMasterServer:
     def __repr__(self):
         return "<RemoteMasterServer %s:%d>" % (self._host, self._port)
 
-    async def connect(self) -> (StreamReader, StreamWriter):
-        reader, writer = await asyncio.open_connection(self._host, self._port)
+    def __eq__(self, other: "RemoteMasterServer"):
+        return isinstance(other, RemoteMasterServer) and self._host == other._host and self._port == other._port
+
+    def __hash__(self):
+        return hash((self._host, self._port))
+
+    async def connect(self, timeout: float = None) -> (StreamReader, StreamWriter):
+        """
+        :param timeout: seconds to wait for the connection to be established, None waits indefinitely
+        :raises asyncio.TimeoutError: if the connection could not be established in time
+        """
+
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(self._host, self._port), timeout)
         return reader, writer
 
-    async def list_servers(self):
-        reader, writer = await self.connect()
+    async def iter_servers(self, connect_timeout: float = None, read_timeout: float = None) \
+            -> AsyncIterator[RedEclipseServer]:
+        """
+        Fetches the server list from the remote master server, yielding the servers as the lines arrive.
 
-        try:
-            servers = []
+        Use like:
+
+            async for server in remote_master_server.iter_servers():
+                ...
+
+        :param connect_timeout: seconds to wait for the connection to be established, None waits indefinitely
+        :param read_timeout: seconds to wait for the complete list once connected, None waits indefinitely
+        :raises asyncio.TimeoutError: if either timeout is exceeded
+        :raises OSError: on connection errors
+        """
+
+        reader, writer = await self.connect(connect_timeout)
 
+        try:
             writer.write(b"update\n")
 
             parser = ServerListParser(self)
 
+            # the read timeout limits the total time spent reading, a peer sending a line now and then cannot keep us
+            # busy forever
+            deadline = None
+            if read_timeout is not None:
+                deadline = asyncio.get_event_loop().time() + read_timeout
+
             while True:
-                line = await reader.readline()
+                timeout = None
+                if deadline is not None:
+                    timeout = max(0.0, deadline - asyncio.get_event_loop().time())
+
+                line = await asyncio.wait_for(reader.readline(), timeout)
 
                 if not line:
                     break
@@ -55,10 +91,15 @@ class RemoteMasterServer:
                 if not parsed:
                     continue
 
-                servers.append(parsed)
-
-            return servers
+                yield parsed
 
         finally:
             writer.close()
             await writer.wait_closed()
+
+    async def list_servers(self, connect_timeout: float = None, read_timeout: float = None) -> List[RedEclipseServer]:
+        """
+        Fetches the complete server list from the remote master server. See iter_servers() for details.
+        """
+
+        return [server async for server in self.iter_servers(connect_timeout, read_timeout)]
@@ -1,5 +1,3 @@
-import re
-
 from .red_eclipse_server import RedEclipseServer
 
 import typing
@@ -9,21 +7,43 @@ if typing.TYPE_CHECKING:
 
 
 class ServerListParser:
+    """
+    Parses the addserver lines sent by master servers in response to update requests, e.g.:
+
+        addserver 1.2.3.4 28801 0 "description" "handle" "role" "branch"
+
+    Rather than matching a regular expression and decoding every field on its own, the whole line is decoded at once
+    and split at the quotes, which is a lot faster on large lists.
+    """
+
     def __init__(self, remote_master_server: "RemoteMasterServer"):
         self._remote_master_server = remote_master_server
 
-    def parse_line(self, line: bytes):
-        line.rstrip(b"\n")
+    def parse_line(self, line: bytes) -> typing.Union[RedEclipseServer, None]:
+        """
+        :param line: line to parse
+        :return: the parsed server, or None if the line is not an addserver line
+        :raises ValueError: if the line is an invalid addserver line
+        """
 
-        if not line.startswith(b"addserver"):
+        if not line.startswith(b"addserver "):
             return None
 
-        match = re.match(rb'addserver ([0-9\.]+) ([0-9]+) ([0-9-]+) "([^"]+)" "([^"]*)" "([^"]*)" "([^"]*)"', line)
+        # the quoted strings alternate with the separating spaces, and nothing may follow the last quote
+        parts = str(line.rstrip(b"\r\n"), "cube2").split('"')
 
-        if not match:
+        if len(parts) != 9 or parts[2] != " " or parts[4] != " " or parts[6] != " " or parts[8]:
             raise ValueError("Invalid addserver response", line)
 
+        fields = parts[0].split(" ")
+
+        # the leading fields must be separated by single spaces, followed by a space before the first quote
+        if len(fields) != 5 or fields[4] or not parts[1]:
+            raise ValueError("Invalid addserver response", line)
+
+        _, ip_addr, port, priority, _ = fields
+
         return RedEclipseServer(
-            *[i.decode("cube2") for i in match.groups()],
+            ip_addr, int(port), int(priority), parts[1], parts[3], parts[5], parts[7],
             remote_master_server=self._remote_master_server
         )
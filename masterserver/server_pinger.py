@@ -1,8 +1,14 @@
 import asyncio
+from collections import namedtuple
 from ipaddress import IPv4Address
-from typing import Union, Text, Tuple
+from typing import Union, Text, Tuple, Dict, List
 
 from . import get_logger
+from .token_bucket import TokenBucket
+
+
+# rtt is None if it could not be measured reliably, i.e., if more than one probe had to be sent
+PingResult = namedtuple("PingResult", ["data", "rtt", "attempts"])
 
 
 class PingError(Exception):
@@ -102,3 +108,204 @@ class ServerPinger:
         finally:
             # make sure we don't leak sockets
             transport.close()
+
+
+class PingServiceProtocol(asyncio.DatagramProtocol):
+    def __init__(self, service: "PingService"):
+        self._service = service
+
+    def datagram_received(self, data: Union[bytes, Text], addr: Tuple[str, int]) -> None:
+        self._service._reply_received(data, addr)
+
+    def error_received(self, exc: Exception) -> None:
+        # the socket isn't connected to a specific server, so we cannot tell which ping caused this error
+        # the affected ping will just time out
+        self._service._logger.debug("error received: %r", exc)
+
+
+class PingService:
+    """
+    Pings servers through a shared set of UDP sockets instead of creating a new socket for every ping.
+
+    Replies are dispatched to the waiting pings by their source address. Multiple concurrent pings to the same address
+    share the first reply which arrives. Optionally, the rate of outgoing packets can be limited.
+    """
+
+    _logger = get_logger("ping_service")
+
+    def __init__(self, sockets_count: int = 1, packets_per_second: float = None):
+        self._sockets_count = sockets_count
+
+        # limits the outgoing packets to keep bandwidth and socket buffer usage flat
+        self._rate_limiter: Union[TokenBucket, None] = None
+
+        if packets_per_second is not None:
+            self._rate_limiter = TokenBucket(packets_per_second)
+
+        self._transports: List[asyncio.DatagramTransport] = []
+
+        # total number of probes sent, for statistics
+        self._probes_sent: int = 0
+
+        # maps (host, port) to the futures waiting for a reply from that address
+        self._waiters: Dict[Tuple[str, int], List[asyncio.Future]] = {}
+
+    @property
+    def probes_sent(self) -> int:
+        return self._probes_sent
+
+    @property
+    def running(self) -> bool:
+        return bool(self._transports)
+
+    async def start(self):
+        if self.running:
+            raise RuntimeError("Ping service already running")
+
+        for i in range(self._sockets_count):
+            self._transports.append(await self._create_transport())
+
+        self._logger.debug("ping service started with %d sockets", len(self._transports))
+
+    async def _create_transport(self) -> asyncio.DatagramTransport:
+        transport, _ = await asyncio.get_event_loop().create_datagram_endpoint(
+            lambda: PingServiceProtocol(self),
+            local_addr=("0.0.0.0", 0)
+        )
+
+        return transport
+
+    async def _get_transport(self, key: Tuple[str, int]) -> asyncio.DatagramTransport:
+        """
+        :param key: address to send the probes to
+        :return: socket to use for this address
+        :raises PingError: if the service has been stopped in the meantime
+        """
+
+        # spread the servers over the available sockets
+        index = hash(key) % len(self._transports)
+        transport = self._transports[index]
+
+        # asyncio closes a transport on unexpected send errors, which must not break all following pings
+        if transport.is_closing():
+            self._logger.warning("ping socket %d has been closed, opening a new one", index)
+
+            new_transport = await self._create_transport()
+
+            if not self.running:
+                new_transport.close()
+                raise PingError("ping service stopped")
+
+            # another ping might have replaced the socket already
+            if self._transports[index] is transport:
+                self._transports[index] = new_transport
+            else:
+                new_transport.close()
+
+            transport = self._transports[index]
+
+        return transport
+
+    def stop(self):
+        for transport in self._transports:
+            transport.close()
+
+        self._transports.clear()
+
+        # make sure no ping is left waiting forever
+        for waiters in self._waiters.values():
+            for future in waiters:
+                if not future.done():
+                    future.set_exception(PingError("ping service stopped"))
+
+    def _reply_received(self, data: bytes, addr: Tuple[str, int]):
+        # addr may contain additional elements for IPv6 sockets, only host and port are relevant to us
+        for future in self._waiters.get(tuple(addr[:2]), []):
+            if not future.done():
+                future.set_result(data)
+
+    async def ping(
+        self, host: Union[IPv4Address, str], port: int, timeout: float = 1, attempts: int = 5
+    ) -> PingResult:
+        if not self.running:
+            raise PingError("ping service not running")
+
+        if not 0 <= port <= 65535:
+            raise PingError("invalid port %d" % port)
+
+        try:
+            host = host.exploded
+        except AttributeError:
+            pass
+
+        key = (host, port)
+
+        transport = await self._get_transport(key)
+
+        loop = asyncio.get_event_loop()
+
+        reply_received = loop.create_future()
+        self._waiters.setdefault(key, []).append(reply_received)
+
+        first_sent = None
+
+        try:
+            # see ServerPinger.ping()
+            for i in range(attempts):
+                self._logger.debug("sending request %d to %s:%d", i, host, port)
+
+                if self._rate_limiter is not None:
+                    await self._rate_limiter.consume()
+
+                    # the reply to a previous attempt might have arrived in the meantime
+                    if reply_received.done():
+                        break
+
+                # another ping might have broken the socket in the meantime
+                if transport.is_closing():
+                    raise PingError("ping socket closed")
+
+                try:
+                    transport.sendto(b"\x81\xec\x04\x01\x00", key)
+                except (OSError, OverflowError, ValueError) as e:
+                    raise PingError("failed to send probe", e)
+
+                self._probes_sent += 1
+
+                if first_sent is None:
+                    first_sent = loop.time()
+
+                # need to check before wait_for to avoid deadlocks
+                if reply_received.done():
+                    break
+
+                try:
+                    # need to shield future, otherwise it will be cancelled by wait_for
+                    await asyncio.wait_for(asyncio.shield(reply_received), timeout=timeout)
+
+                except asyncio.TimeoutError:
+                    continue
+
+                else:
+                    break
+
+            if not reply_received.done():
+                raise TimeoutError()
+
+            data = reply_received.result()
+
+            # like TCP, we only measure the round trip time if there's no ambiguity which probe has been answered
+            if i == 0 and first_sent is not None:
+                return PingResult(data, loop.time() - first_sent, 1)
+
+            return PingResult(data, None, i + 1)
+
+        finally:
+            waiters = self._waiters[key]
+            waiters.remove(reply_received)
+
+            if not waiters:
+                del self._waiters[key]
+
+            if not reply_received.done():
+                reply_received.cancel()
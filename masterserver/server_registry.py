@@ -0,0 +1,304 @@
+from collections import namedtuple
+from typing import Dict, FrozenSet, Iterable, Iterator, Tuple, Union
+
+from .change_log import ChangeLog
+from .red_eclipse_server import RedEclipseServer
+
+import typing
+
+if typing.TYPE_CHECKING:
+    from .remote_master_server import RemoteMasterServer
+
+
+# result of ServerRegistry.merge_remote_list()
+# new: servers which are not listed yet and need to be verified before adding them
+# updated: listed servers which have been replaced by the remote's current entries
+# removed: servers which the remote doesn't list any more and which have been removed
+MergeResult = namedtuple("MergeResult", ["new", "updated", "removed"])
+
+
+class ServerListSnapshot:
+    """
+    Immutable view of the server list at a certain registry generation.
+
+    Snapshots can be shared by any number of readers without copying or locking. Representations derived from the list,
+    e.g., the response to update requests, are cached on the snapshot, so they're computed at most once per generation.
+    """
+
+    def __init__(self, generation: int, servers: Tuple[RedEclipseServer, ...]):
+        self._generation: int = generation
+        self._servers: Tuple[RedEclipseServer, ...] = servers
+
+        # built on demand
+        self._keys: Union[FrozenSet[int], None] = None
+        self._update_response: Union[bytes, None] = None
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    @property
+    def servers(self) -> Tuple[RedEclipseServer, ...]:
+        return self._servers
+
+    def __len__(self):
+        return len(self._servers)
+
+    def __iter__(self) -> Iterator[RedEclipseServer]:
+        return iter(self._servers)
+
+    def __contains__(self, server: RedEclipseServer):
+        if self._keys is None:
+            self._keys = frozenset(server.key for server in self._servers)
+
+        return server.key in self._keys
+
+    def update_response(self) -> bytes:
+        """
+        :return: cube2 encoded response to the update command, listing all servers
+        """
+
+        if self._update_response is None:
+            lines = [
+                "setversion 160 230",
+                "clearservers",
+            ]
+
+            for server in self._servers:
+                lines.append("addserver %s" % server.addserver_line())
+
+            response = "\n".join(lines)
+            response += "\n"
+
+            self._update_response = response.encode("cube2")
+
+        return self._update_response
+
+
+class ServerRegistry:
+    """
+    Registry of the servers listed by the master server.
+
+    Servers are stored by their packed address (see RedEclipseServer.key), so looking up, adding, replacing and removing
+    a server doesn't depend on the number of servers listed. Additionally, the registry maintains indexes by branch and
+    by origin (i.e., the remote master server the entry has been fetched from, or None for servers which registered
+    with us directly).
+
+    Every change that affects the rendered server list increments the registry's generation. Readers get an immutable
+    snapshot of the list, which is replaced by a new one on the first read after a change (copy on write).
+
+    Changes to the servers which registered with us directly are recorded in a change log, which is used to sync them to
+    peers.
+
+    The registry itself does not do any locking.
+    """
+
+    def __init__(self):
+        self._servers: Dict[int, RedEclipseServer] = {}
+
+        self._generation: int = 0
+        self._snapshot: ServerListSnapshot = ServerListSnapshot(0, ())
+
+        # secondary indexes, mapping to the servers by their keys
+        self._by_branch: Dict[str, Dict[int, RedEclipseServer]] = {}
+        self._by_remote: Dict[Union["RemoteMasterServer", None], Dict[int, RedEclipseServer]] = {}
+
+        self._change_log: ChangeLog = ChangeLog()
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    @property
+    def change_log(self) -> ChangeLog:
+        return self._change_log
+
+    @property
+    def snapshot(self) -> ServerListSnapshot:
+        # creating the snapshot on the first read rather than after every change means that a batch of changes, e.g.,
+        # from polling a remote master server, results in a single copy of the list
+        if self._snapshot.generation != self._generation:
+            self._snapshot = ServerListSnapshot(self._generation, tuple(self._servers.values()))
+
+        return self._snapshot
+
+    def __len__(self):
+        return len(self._servers)
+
+    def __iter__(self) -> Iterator[RedEclipseServer]:
+        return iter(self._servers.values())
+
+    def __contains__(self, server: RedEclipseServer):
+        return server.key in self._servers
+
+    @staticmethod
+    def _index_add(index: dict, value, server: RedEclipseServer):
+        index.setdefault(value, {})[server.key] = server
+
+    @staticmethod
+    def _index_remove(index: dict, value, server: RedEclipseServer):
+        servers = index[value]
+        del servers[server.key]
+
+        # don't keep empty buckets around
+        if not servers:
+            del index[value]
+
+    def get(self, server: RedEclipseServer) -> Union[RedEclipseServer, None]:
+        """
+        :param server: server (or an equal instance) to look up
+        :return: the instance stored in the registry, or None if the server is not listed
+        """
+
+        return self._servers.get(server.key)
+
+    def upsert(self, server: RedEclipseServer) -> Union[RedEclipseServer, None]:
+        """
+        Adds a server, or replaces the stored instance if it is listed already.
+
+        :param server: server to add
+        :return: the replaced instance, or None if the server has not been listed before
+        """
+
+        old_server = self._servers.get(server.key)
+
+        if old_server is not None:
+            self._index_remove(self._by_branch, old_server.branch, old_server)
+            self._index_remove(self._by_remote, old_server.remote_master_server, old_server)
+
+        self._servers[server.key] = server
+        self._index_add(self._by_branch, server.branch, server)
+        self._index_add(self._by_remote, server.remote_master_server, server)
+
+        # most updates, e.g., from polling remote master servers, don't change anything
+        if (
+            old_server is None
+            or old_server.addserver_line() != server.addserver_line()
+            or old_server.remote_master_server != server.remote_master_server
+        ):
+            self._generation += 1
+
+            if server.remote_master_server is None:
+                self._change_log.record(server)
+
+            elif old_server is not None and old_server.remote_master_server is None:
+                self._change_log.record(old_server, removed=True)
+
+        return old_server
+
+    def remove(self, server: RedEclipseServer) -> RedEclipseServer:
+        """
+        :param server: server (or an equal instance) to remove
+        :return: the removed instance
+        :raises KeyError: if the server is not listed
+        """
+
+        old_server = self._servers.pop(server.key)
+
+        self._index_remove(self._by_branch, old_server.branch, old_server)
+        self._index_remove(self._by_remote, old_server.remote_master_server, old_server)
+
+        self._generation += 1
+
+        if old_server.remote_master_server is None:
+            self._change_log.record(old_server, removed=True)
+
+        return old_server
+
+    def set_description(self, server: RedEclipseServer, description: str):
+        """
+        Updates a server's description. Servers should not be modified directly once they're in the registry, since
+        the registry couldn't keep track of the change then.
+
+        :param server: server to update
+        :param description: new description
+        """
+
+        old_description = server.description
+        server.description = description
+
+        # the description property might return a placeholder, hence the comparison after the update
+        if server.description == old_description:
+            return
+
+        # the instance might have been replaced or removed in the meantime, then the change doesn't affect the list
+        if self._servers.get(server.key) is server:
+            self._generation += 1
+
+            if server.remote_master_server is None:
+                self._change_log.record(server)
+
+    def merge_remote_list(self, remote_master_server: "RemoteMasterServer",
+                          servers: Iterable[RedEclipseServer]) -> MergeResult:
+        """
+        Replaces the entries contributed by a remote master server with its current list, in a single pass.
+
+        Entries which are listed already are replaced by the new instances, keeping their ping history. Entries which
+        the remote master server doesn't list any more are removed. Entries which aren't listed yet are not added, but
+        returned, since they have to be verified first.
+
+        Servers which registered with us directly always take precedence over proxied entries, and an entry that has
+        been fetched from another remote master server already is kept until that master server stops listing it.
+
+        :param remote_master_server: master server the list has been fetched from
+        :param servers: servers listed by the remote master server
+        :return: new, updated and removed servers
+        """
+
+        previous = dict(self._by_remote.get(remote_master_server, {}))
+
+        new = []
+        updated = []
+        seen = set()
+
+        for server in servers:
+            key = server.key
+
+            # the first entry wins in case a master server lists a server multiple times
+            if key in seen:
+                continue
+
+            seen.add(key)
+
+            old_server = previous.pop(key, None)
+
+            if old_server is None:
+                # listed by someone else already
+                if key not in self._servers:
+                    new.append(server)
+
+                continue
+
+            server.ping_history = old_server.ping_history
+            server.verified = old_server.verified
+
+            self.upsert(server)
+            updated.append(server)
+
+        removed = [self.remove(server) for server in previous.values()]
+
+        return MergeResult(new, updated, removed)
+
+    def by_branch(self, branch: str) -> Tuple[RedEclipseServer, ...]:
+        return tuple(self._by_branch.get(branch, {}).values())
+
+    def by_remote(self, remote_master_server: Union["RemoteMasterServer", None]) -> Tuple[RedEclipseServer, ...]:
+        return tuple(self._by_remote.get(remote_master_server, {}).values())
+
+    def own(self) -> Tuple[RedEclipseServer, ...]:
+        """
+        :return: servers which have registered with this master server directly
+        """
+
+        return self.by_remote(None)
+
+    def proxied(self) -> Tuple[RedEclipseServer, ...]:
+        """
+        :return: servers which have been fetched from remote master servers
+        """
+
+        return tuple(
+            server
+            for remote_master_server, servers in self._by_remote.items() if remote_master_server is not None
+            for server in servers.values()
+        )
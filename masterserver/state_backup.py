@@ -0,0 +1,302 @@
+import asyncio
+import math
+import os
+import struct
+import time
+from ipaddress import IPv4Address
+from typing import List, Tuple, Union
+
+from . import get_logger
+from .red_eclipse_server import RedEclipseServer
+from .remote_master_server import RemoteMasterServer
+from .server_registry import ServerListSnapshot
+
+
+class BackupFormatError(ValueError):
+    pass
+
+
+class StateBackup:
+    """
+    Writes backups of the server list to a file.
+
+    The file is written in a worker thread, so a slow disk doesn't block the event loop. To make sure a crash while
+    writing cannot leave a truncated backup behind, the data is written to a temporary file first, which then replaces
+    the backup atomically. Snapshots of a generation which has been backed up already are skipped.
+
+    Backups use a compact, versioned binary format which preserves all fields of the server entries as well as the
+    state of their ping histories, so a restarted master server can list complete entries right away. The file starts
+    with a header (magic, version, time written, number of records). Every record consists of a fixed size part
+    (address, port, priority, last successful ping, smoothed RTT) followed by length-prefixed strings (description,
+    auth handle, role, branch, origin master server host), the origin master server's port and the last query reply.
+    Backups in the old plain text format (one ip:port pair per line) can still be loaded.
+    """
+
+    MAGIC = b"REMS"
+    VERSION = 1
+
+    # magic, version, time written, number of records
+    _header = struct.Struct("<4sHdI")
+
+    # IP address, port, priority, last successful ping, smoothed RTT
+    _record = struct.Struct("<IHidd")
+
+    _length = struct.Struct("<H")
+
+    # marks strings which are None
+    _NONE = 0xFFFF
+
+    _logger = get_logger("state-backup")
+
+    def __init__(self, path: str):
+        self._path: str = path
+
+        # statistics of the last backup written
+        self._last_generation: Union[int, None] = None
+        self._last_duration: Union[float, None] = None
+        self._last_bytes_written: int = 0
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def last_generation(self) -> Union[int, None]:
+        return self._last_generation
+
+    @property
+    def last_duration(self) -> Union[float, None]:
+        return self._last_duration
+
+    @property
+    def last_bytes_written(self) -> int:
+        return self._last_bytes_written
+
+    @classmethod
+    def _pack_bytes(cls, parts: list, data: Union[bytes, None]):
+        if data is None:
+            parts.append(cls._length.pack(cls._NONE))
+            return
+
+        # longer values cannot occur in practice, query replies fit into a single UDP packet
+        data = data[:cls._NONE - 1]
+
+        parts.append(cls._length.pack(len(data)))
+        parts.append(data)
+
+    @classmethod
+    def _pack_string(cls, parts: list, value: Union[str, None]):
+        cls._pack_bytes(parts, None if value is None else value.encode())
+
+    @staticmethod
+    def _collect(snapshot: ServerListSnapshot) -> list:
+        """
+        Collects the data to back up. Must be called on the event loop, since the ping histories are modified there.
+        """
+
+        records = []
+
+        for server in snapshot:
+            # most entries are never pinged by us (e.g., those of peers), so don't create histories for them
+            history = server.existing_ping_history
+
+            if history is None:
+                last_success = srtt = last_reply = None
+            else:
+                last_success, srtt, last_reply = history.last_success, history.srtt, history.last_reply
+
+            remote = server.remote_master_server
+
+            records.append((
+                int(server.ip_addr), server.port, server.priority, last_success, srtt,
+                server.description, server.auth_handle, server.role, server.branch,
+                None if remote is None else remote.host, 0 if remote is None else remote.port,
+                last_reply,
+            ))
+
+        return records
+
+    @classmethod
+    def _serialize(cls, records: list, written: float) -> bytes:
+        parts = []
+        count = 0
+
+        for (ip, port, priority, last_success, srtt, description, handle, role, branch, remote_host, remote_port,
+             last_reply) in records:
+            record_parts = []
+
+            try:
+                record_parts.append(cls._record.pack(
+                    ip, port, priority,
+                    math.nan if last_success is None else last_success,
+                    math.nan if srtt is None else srtt,
+                ))
+
+                for value in (description, handle, role, branch, remote_host):
+                    cls._pack_string(record_parts, value)
+
+                record_parts.append(cls._length.pack(remote_port))
+
+                cls._pack_bytes(record_parts, last_reply)
+
+            except struct.error:
+                # a single entry with an odd value must not break the whole backup
+                cls._logger.exception("cannot back up server %s:%d, skipping", IPv4Address(ip), port)
+                continue
+
+            parts += record_parts
+            count += 1
+
+        return cls._header.pack(cls.MAGIC, cls.VERSION, written, count) + b"".join(parts)
+
+    def _write(self, records: list) -> int:
+        data = self._serialize(records, time.time())
+
+        temp_path = self._path + ".tmp"
+
+        with open(temp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(temp_path, self._path)
+
+        return len(data)
+
+    def _touch(self):
+        try:
+            os.utime(self._path)
+        except OSError:
+            pass
+
+    @classmethod
+    def _parse(cls, data: bytes) -> Tuple[List[RedEclipseServer], float]:
+        view = memoryview(data)
+
+        try:
+            magic, version, written, count = cls._header.unpack_from(view)
+
+            if version != cls.VERSION:
+                raise BackupFormatError("unsupported backup version %d" % version)
+
+            offset = cls._header.size
+            servers = []
+
+            def next_bytes() -> Union[bytes, None]:
+                nonlocal offset
+
+                length, = cls._length.unpack_from(view, offset)
+                offset += cls._length.size
+
+                if length == cls._NONE:
+                    return None
+
+                if offset + length > len(view):
+                    raise BackupFormatError("backup is truncated")
+
+                rv = bytes(view[offset:offset + length])
+                offset += length
+                return rv
+
+            def next_string() -> Union[str, None]:
+                rv = next_bytes()
+                return None if rv is None else rv.decode()
+
+            for _ in range(count):
+                ip, port, priority, last_success, srtt = cls._record.unpack_from(view, offset)
+                offset += cls._record.size
+
+                description, handle, role, branch, remote_host = [next_string() for _ in range(5)]
+
+                remote_port, = cls._length.unpack_from(view, offset)
+                offset += cls._length.size
+
+                last_reply = next_bytes()
+
+                remote = None
+                if remote_host is not None:
+                    remote = RemoteMasterServer(remote_host, remote_port)
+
+                server = RedEclipseServer(str(IPv4Address(ip)), port, priority, description, handle, role, branch,
+                                          remote)
+
+                if not math.isnan(last_success):
+                    server.ping_history.restore(
+                        None if math.isnan(srtt) else srtt,
+                        last_success,
+                        last_reply
+                    )
+
+                servers.append(server)
+
+        except struct.error:
+            raise BackupFormatError("backup is truncated")
+
+        return servers, written
+
+    @staticmethod
+    def _parse_legacy(data: bytes) -> List[RedEclipseServer]:
+        servers = []
+
+        for line in data.decode().splitlines():
+            line = line.strip()
+
+            if not line:
+                continue
+
+            ip_addr, port = line.split(":")
+            servers.append(RedEclipseServer(ip_addr, int(port), 0, "", "", "", ""))
+
+        return servers
+
+    def load(self) -> Tuple[List[RedEclipseServer], float]:
+        """
+        Reads the backup. Blocks, so it should be run in an executor.
+
+        :return: backed up servers and the time the backup has been written
+        :raises OSError: if the backup cannot be read
+        :raises BackupFormatError: if the backup is malformed
+        """
+
+        with open(self._path, "rb") as f:
+            mtime = os.fstat(f.fileno()).st_mtime
+            data = f.read()
+
+        if data.startswith(self.MAGIC):
+            servers, written = self._parse(data)
+
+            # backups are not rewritten while the list doesn't change, only their modification time is updated
+            return servers, max(written, mtime)
+
+        # backups written by older versions only contain the addresses
+        return self._parse_legacy(data), mtime
+
+    async def save(self, snapshot: ServerListSnapshot) -> bool:
+        """
+        Backs up a snapshot unless it has been backed up already.
+
+        :param snapshot: snapshot to back up
+        :return: whether the backup has been written
+        """
+
+        if snapshot.generation == self._last_generation:
+            self._logger.debug("Server list unchanged since last backup, skipping")
+
+            # the backup is still current, which must be visible to load()
+            await asyncio.get_event_loop().run_in_executor(None, self._touch)
+
+            return False
+
+        started = time.monotonic()
+
+        # the servers' ping histories keep changing on the event loop, so their state is collected here, and only the
+        # encoding and writing are done in another thread
+        records = self._collect(snapshot)
+
+        bytes_written = await asyncio.get_event_loop().run_in_executor(None, self._write, records)
+
+        self._last_generation = snapshot.generation
+        self._last_duration = time.monotonic() - started
+        self._last_bytes_written = bytes_written
+
+        return True
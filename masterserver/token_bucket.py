@@ -0,0 +1,64 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter. Tokens are refilled continuously at the given rate, up to the bucket's capacity.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        if capacity is None:
+            capacity = rate
+
+        self._rate: float = float(rate)
+        self._capacity: float = float(capacity)
+
+        # start with a full bucket
+        self._tokens: float = self._capacity
+        self._last_refill: float = time.monotonic()
+
+    @property
+    def rate(self):
+        return self._rate
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self._capacity, self._tokens + (now - self._last_refill) * self._rate)
+        self._last_refill = now
+
+    def try_consume(self, tokens: float = 1) -> bool:
+        """
+        Takes tokens from the bucket if enough are available.
+
+        :param tokens: number of tokens to take
+        :return: whether the tokens could be taken
+        """
+
+        self._refill()
+
+        if self._tokens < tokens:
+            return False
+
+        self._tokens -= tokens
+        return True
+
+    async def consume(self, tokens: float = 1):
+        """
+        Takes tokens from the bucket, waiting until they are available if necessary.
+
+        The tokens are reserved immediately, so concurrent callers are served in the order they called this method.
+
+        :param tokens: number of tokens to take
+        """
+
+        self._refill()
+
+        self._tokens -= tokens
+
+        if self._tokens < 0:
+            await asyncio.sleep(-self._tokens / self._rate)
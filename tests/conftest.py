@@ -0,0 +1,25 @@
+import pytest
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def fake_clock(monkeypatch):
+    """
+    Replaces time.monotonic as seen by a given module with a clock which only advances when the test says so.
+
+    Usage: clock = fake_clock(module), then advance with clock.now += seconds.
+    """
+
+    def patch(module) -> FakeClock:
+        clock = FakeClock()
+        monkeypatch.setattr(module.time, "monotonic", clock)
+        return clock
+
+    return patch
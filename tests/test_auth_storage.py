@@ -0,0 +1,83 @@
+import json
+import os
+
+import pytest
+
+from masterserver.auth import AuthDBEntry, AuthStorage
+
+
+def write_users(path, users: dict):
+    # write a new file, which is then moved in place, like editors and deployment tools usually do
+    temp_path = str(path) + ".tmp"
+
+    with open(temp_path, "w") as f:
+        json.dump(users, f)
+
+    os.replace(temp_path, str(path))
+
+
+@pytest.mark.asyncio
+async def test_lookup_and_reload(tmp_path, monkeypatch):
+    path = tmp_path / "auth.json"
+    write_users(path, {"alice": {"pubkey": "+abc", "flags": ["a", "m"]}, "bob": {"flags": []}})
+
+    storage = AuthStorage(str(path), check_interval=0)
+    await storage.refresh()
+
+    assert storage.get_user("alice") == AuthDBEntry("+abc", ["a", "m"])
+    assert storage.get_user_flags("alice") == "am"
+
+    with pytest.raises(ValueError):
+        storage.get_user("bob")
+
+    with pytest.raises(KeyError):
+        storage.get_user("carol")
+
+    # the file must not be read again unless it has changed
+    loads = []
+    original_load = storage._load
+
+    def counting_load():
+        loads.append(1)
+        return original_load()
+
+    monkeypatch.setattr(storage, "_load", counting_load)
+
+    await storage.refresh()
+    assert loads == []
+
+    write_users(path, {"carol": {"pubkey": "-def", "flags": []}})
+    await storage.refresh()
+
+    assert storage.get_user("carol").pubkey == "-def"
+    assert len(storage) == 1
+    assert loads == [1]
+
+
+@pytest.mark.asyncio
+async def test_invalid_file_keeps_users(tmp_path):
+    path = tmp_path / "auth.json"
+    write_users(path, {"alice": {"pubkey": "+abc", "flags": []}})
+
+    storage = AuthStorage(str(path), check_interval=0)
+    await storage.refresh()
+
+    path.write_text("{")
+    await storage.refresh()
+
+    assert storage.get_user("alice").pubkey == "+abc"
+
+    # valid JSON, but not an object
+    write_users(path, ["alice"])
+    await storage.refresh()
+
+    assert storage.get_user("alice").pubkey == "+abc"
+
+
+@pytest.mark.asyncio
+async def test_missing_file(tmp_path):
+    storage = AuthStorage(str(tmp_path / "auth.json"), check_interval=0)
+    await storage.refresh()
+
+    with pytest.raises(KeyError):
+        storage.get_user("alice")
@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+from masterserver.change_log import ChangeLog
+from masterserver.red_eclipse_server import RedEclipseServer
+from masterserver.remote_master_server import RemoteMasterServer
+from masterserver.server_registry import ServerRegistry
+
+
+def test_since():
+    change_log = ChangeLog(max_length=3)
+
+    servers = [RedEclipseServer("1.2.3.%d" % i, 28801) for i in range(5)]
+
+    assert change_log.since(0) == []
+
+    for server in servers[:3]:
+        change_log.record(server)
+
+    assert [change.server for change in change_log.since(0)] == servers[:3]
+    assert [change.server for change in change_log.since(2)] == servers[2:3]
+    assert change_log.since(3) == []
+
+    # unknown sequence numbers require a full resync
+    assert change_log.since(4) is None
+
+    change_log.record(servers[3], removed=True)
+    change_log.record(servers[4])
+
+    changes = change_log.since(2)
+    assert [(change.seq, change.server, change.removed) for change in changes] == [
+        (3, servers[2], False), (4, servers[3], True), (5, servers[4], False)
+    ]
+
+    # the first changes have been dropped
+    assert change_log.since(1) is None
+
+
+@pytest.mark.asyncio
+async def test_wait():
+    change_log = ChangeLog()
+
+    assert not await change_log.wait(0, 0.01)
+
+    waiter = asyncio.ensure_future(change_log.wait(0, 5))
+    await asyncio.sleep(0)
+
+    change_log.record(RedEclipseServer("1.2.3.4", 28801))
+    assert await waiter
+
+    # changes the caller doesn't know about yet are returned right away
+    assert await change_log.wait(0, 5)
+
+
+def test_registry_records_own_servers():
+    registry = ServerRegistry()
+    change_log = registry.change_log
+
+    own = RedEclipseServer("1.2.3.4", 28801, 0, "own", "", "", "stable")
+    proxied = RedEclipseServer("1.2.3.5", 28801, 0, "proxied", "", "", "stable", RemoteMasterServer("1.2.3.6"))
+
+    registry.upsert(own)
+    registry.upsert(proxied)
+    registry.set_description(own, "changed")
+
+    # unchanged entries are not recorded
+    registry.upsert(own)
+
+    registry.remove(own)
+
+    assert [(change.server, change.removed) for change in change_log.since(0)] == [
+        (own, False), (own, False), (own, True)
+    ]
@@ -1,3 +1,6 @@
+import codecs
+import io
+
 import pytest
 
 from masterserver._codec import register_codec, Cube2Codec
@@ -28,3 +31,36 @@ def test_cube2_decode(test_bytes, expected_result):
 ])
 def test_cube2_encode_decode(test_string):
     assert test_string == test_string.encode("cube2").decode("cube2")
+
+
+def test_cube2_encode_invalid_character():
+    with pytest.raises(UnicodeEncodeError):
+        "€".encode("cube2")
+
+
+def test_cube2_all_bytes_roundtrip():
+    data = bytes(range(256))
+    assert data.decode("cube2").encode("cube2") == data
+
+
+def test_cube2_incremental():
+    test_string = "äöüÄÖÜ abc"
+
+    encoder = codecs.getincrementalencoder("cube2")()
+    encoded = b"".join(encoder.encode(char) for char in test_string) + encoder.encode("", final=True)
+    assert encoded == test_string.encode("cube2")
+
+    decoder = codecs.getincrementaldecoder("cube2")()
+    decoded = "".join(decoder.decode(bytes([byte])) for byte in encoded) + decoder.decode(b"", final=True)
+    assert decoded == test_string
+
+
+def test_cube2_stream():
+    test_string = "äöüÄÖÜ abc\n"
+
+    buffer = io.BytesIO()
+    codecs.getwriter("cube2")(buffer).write(test_string)
+    assert buffer.getvalue() == test_string.encode("cube2")
+
+    buffer.seek(0)
+    assert codecs.getreader("cube2")(buffer).read() == test_string
@@ -0,0 +1,57 @@
+import pytest
+
+from masterserver import negative_cache
+from masterserver.negative_cache import NegativeCache
+from masterserver.red_eclipse_server import RedEclipseServer
+
+
+@pytest.fixture
+def clock(fake_clock):
+    return fake_clock(negative_cache)
+
+
+def test_backoff(clock):
+    cache = NegativeCache(ttl=10, max_ttl=25)
+    server = RedEclipseServer("1.2.3.4", 28801)
+
+    assert not cache.should_skip(server)
+
+    cache.record_failure(server)
+    assert cache.should_skip(server)
+    assert cache.retry_in(server) == 10
+
+    clock.now += 10
+    assert not cache.should_skip(server)
+
+    # consecutive failures double the time to live, up to the maximum
+    cache.record_failure(server)
+    assert cache.retry_in(server) == 20
+
+    clock.now += 20
+    cache.record_failure(server)
+    assert cache.retry_in(server) == 25
+
+    # servers which haven't failed for a long time start over
+    clock.now += 100
+    cache.record_failure(server)
+    assert cache.retry_in(server) == 10
+
+    cache.record_success(server)
+    assert not cache.should_skip(server)
+
+    assert cache.pings_avoided == 1
+
+
+def test_size_bound(clock):
+    cache = NegativeCache(max_entries=10)
+
+    servers = [RedEclipseServer("1.2.3.%d" % i, 28801) for i in range(20)]
+
+    for server in servers:
+        cache.record_failure(server)
+
+    assert len(cache) == 10
+
+    # the oldest entries have been evicted
+    assert not cache.should_skip(servers[0])
+    assert cache.should_skip(servers[-1])
@@ -0,0 +1,47 @@
+from masterserver.ping_history import PingHistory
+
+
+def test_defaults():
+    history = PingHistory()
+
+    assert history.timeout == PingHistory.DEFAULT_TIMEOUT
+    assert history.attempts == PingHistory.DEFAULT_ATTEMPTS
+    assert history.interval_multiplier == 1
+
+
+def test_rtt_based_timeout():
+    history = PingHistory()
+
+    for i in range(20):
+        history.record_success(0.05)
+
+    assert abs(history.srtt - 0.05) < 0.001
+    assert history.timeout == PingHistory.MIN_TIMEOUT
+
+    for i in range(20):
+        history.record_success(0.4)
+
+    assert PingHistory.MIN_TIMEOUT < history.timeout <= PingHistory.DEFAULT_TIMEOUT
+
+
+def test_stable_servers_are_pinged_less_often():
+    history = PingHistory()
+
+    multipliers = []
+    for i in range(4 * PingHistory.STABLE_STREAK):
+        history.record_success(0.05)
+        multipliers.append(history.interval_multiplier)
+
+    assert multipliers[0] == 1
+    assert multipliers[PingHistory.STABLE_STREAK] == 2
+    assert multipliers[-1] == PingHistory.MAX_INTERVAL_MULTIPLIER
+    assert history.attempts == PingHistory.STABLE_ATTEMPTS
+
+    # servers which need retries or fail lose their stable status
+    history.record_success(None, attempts=2)
+    assert not history.stable
+    assert history.interval_multiplier == 1
+    assert history.attempts == PingHistory.DEFAULT_ATTEMPTS
+
+    history.record_failure()
+    assert history.failures == 1
@@ -0,0 +1,89 @@
+import pytest
+
+from masterserver import ping_scheduler
+from masterserver.ping_scheduler import PingScheduler
+from masterserver.red_eclipse_server import RedEclipseServer
+
+
+@pytest.fixture
+def clock(fake_clock):
+    return fake_clock(ping_scheduler)
+
+
+def make_servers(count: int):
+    return [RedEclipseServer("1.2.%d.%d" % (i // 256, i % 256), 28801) for i in range(count)]
+
+
+def test_pings_spread_evenly(clock):
+    scheduler = PingScheduler(interval=60, slots_count=60)
+
+    servers = make_servers(120)
+    for server in servers:
+        scheduler.schedule(server)
+
+    assert len(scheduler) == 120
+
+    # every second, two servers are due
+    due_counts = []
+    for i in range(60):
+        clock.now += 1
+        due_counts.append(len(scheduler.pop_due()))
+
+    assert due_counts == [2] * 60
+
+    # in the next period, every server is due exactly once more
+    pinged = []
+    for i in range(60):
+        clock.now += 1
+        pinged += scheduler.pop_due()
+
+    assert sorted(pinged, key=hash) == sorted(servers, key=hash)
+
+
+def test_schedule_replaces_instance(clock):
+    scheduler = PingScheduler(interval=60, slots_count=60)
+
+    old, new = RedEclipseServer("1.2.3.4", 28801, 1), RedEclipseServer("1.2.3.4", 28801, 2)
+
+    scheduler.schedule(old)
+    scheduler.schedule(new)
+
+    assert len(scheduler) == 1
+
+    clock.now += 60
+    assert [server.priority for server in scheduler.pop_due()] == [2]
+
+
+def test_unschedule(clock):
+    scheduler = PingScheduler(interval=60, slots_count=60)
+
+    servers = make_servers(10)
+    for server in servers:
+        scheduler.schedule(server)
+
+    for server in servers[:5]:
+        scheduler.unschedule(server)
+
+    # rescheduling a server mustn't make it due twice
+    scheduler.schedule(servers[0])
+
+    clock.now += 60
+    assert sorted(scheduler.pop_due(), key=hash) == sorted(servers[5:] + servers[:1], key=hash)
+
+
+def test_interval_multiplier(clock):
+    scheduler = PingScheduler(interval=60, slots_count=60)
+
+    server = RedEclipseServer("1.2.3.4", 28801)
+    scheduler.schedule(server, interval_multiplier=3)
+
+    clock.now += 60
+    assert scheduler.pop_due() == [server]
+
+    # the next ping is due three intervals later
+    clock.now += 120
+    assert scheduler.pop_due() == []
+
+    clock.now += 60
+    assert scheduler.pop_due() == [server]
+    assert scheduler.pings_skipped == 4
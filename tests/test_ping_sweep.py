@@ -0,0 +1,59 @@
+import asyncio
+import time
+
+import pytest
+
+from masterserver.ping_sweep import PingSweep
+from masterserver.red_eclipse_server import RedEclipseServer
+from masterserver.token_bucket import TokenBucket
+
+
+@pytest.mark.asyncio
+async def test_ping_sweep_concurrency():
+    servers = [RedEclipseServer("1.2.3.%d" % i, 28801) for i in range(50)]
+
+    running = 0
+    max_running = 0
+
+    async def ping(server: RedEclipseServer):
+        nonlocal running, max_running
+
+        running += 1
+        max_running = max(running, max_running)
+
+        await asyncio.sleep(0.01)
+
+        running -= 1
+
+        # simulate some unreachable servers
+        if server.ip_addr.packed[-1] % 2:
+            return None
+
+        return server.ip_addr.packed
+
+    sweep = PingSweep(concurrency=5)
+    replies = await sweep.run(servers, ping)
+
+    assert max_running == 5
+    assert replies == [None if i % 2 else server.ip_addr.packed for i, server in enumerate(servers)]
+
+    assert sweep.last_servers_count == len(servers)
+    assert sweep.last_duration > 0
+
+
+def test_token_bucket_try_consume():
+    bucket = TokenBucket(rate=1, capacity=3)
+
+    assert [bucket.try_consume() for _ in range(4)] == [True, True, True, False]
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_consume():
+    bucket = TokenBucket(rate=100, capacity=10)
+
+    started = time.monotonic()
+
+    # the first ten tokens are available immediately, the other 20 take 0.2 seconds
+    await asyncio.gather(*[bucket.consume() for _ in range(30)])
+
+    assert 0.15 < time.monotonic() - started < 0.5
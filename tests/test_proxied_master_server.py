@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+from masterserver import circuit_breaker
+from masterserver.circuit_breaker import CircuitBreaker
+from masterserver.proxied_master_server import ProxiedMasterServer
+from masterserver.remote_master_server import RemoteMasterServer
+
+
+@pytest.fixture
+def clock(fake_clock):
+    return fake_clock(circuit_breaker)
+
+
+def test_circuit_breaker_backoff(clock):
+    breaker = CircuitBreaker(failure_threshold=2, backoff=10, max_backoff=25)
+
+    breaker.record_failure()
+    assert breaker.allow()
+    assert not breaker.is_open
+
+    breaker.record_failure()
+    assert breaker.is_open
+    assert not breaker.allow()
+
+    clock.now += 10
+    assert breaker.allow()
+
+    # a failed trial call doubles the backoff
+    breaker.record_failure()
+    assert breaker.retry_in == 20
+
+    clock.now += 20
+    breaker.record_failure()
+    assert breaker.retry_in == 25
+
+    clock.now += 25
+    breaker.record_success()
+    assert not breaker.is_open
+    assert breaker.consecutive_failures == 0
+
+
+async def handle_hanging_client(reader, writer):
+    # accept the request, but never reply
+    await reader.readline()
+    await asyncio.sleep(10)
+
+
+async def handle_client(reader, writer):
+    await reader.readline()
+    writer.write(b'addserver 1.2.3.4 28801 0 "abc" "" "" "stable"\n')
+    await writer.drain()
+    writer.close()
+
+
+@pytest.mark.asyncio
+async def test_poll(unused_tcp_port):
+    server = await asyncio.start_server(handle_client, "127.0.0.1", unused_tcp_port)
+
+    try:
+        proxied = ProxiedMasterServer(RemoteMasterServer("127.0.0.1", unused_tcp_port))
+
+        servers = await proxied.poll()
+        assert [server.description for server in servers] == ["abc"]
+
+        assert proxied.polls == 1
+        assert proxied.failures == 0
+        assert proxied.last_entries_count == 1
+        assert proxied.last_latency >= 0
+
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+@pytest.mark.asyncio
+async def test_poll_timeout_opens_circuit(unused_tcp_port):
+    server = await asyncio.start_server(handle_hanging_client, "127.0.0.1", unused_tcp_port)
+
+    try:
+        proxied = ProxiedMasterServer(
+            RemoteMasterServer("127.0.0.1", unused_tcp_port), read_timeout=0.1,
+            circuit_breaker=CircuitBreaker(failure_threshold=1)
+        )
+
+        assert await proxied.poll() is None
+        assert proxied.failures == 1
+        assert "TimeoutError" in proxied.last_error
+
+        # the master server must not be contacted again until the backoff has passed
+        assert await proxied.poll() is None
+        assert proxied.polls == 1
+        assert proxied.skipped == 1
+
+    finally:
+        server.close()
+        await server.wait_closed()
@@ -1,13 +1,18 @@
 import pytest
 
-from masterserver.parsed_query_reply import ParsedQueryReply
+from masterserver.parsed_query_reply import ParsedQueryReply, Cube2BytesStream, TruncatedQueryReplyError, parse_many
+
+
+QUERY_REPLY = (
+    b'\x81\xec\x04\x01\x00\x00\x0f\x80\xe6\x00\x03\x00\x80X\x02 \x00\x80\x86\x13\x05\x01\x06\x00\x02@\x00\x00'
+    b'dropzone\x00Einherjer Europe [linuxiuvat.de]\x00\x00'
+)
 
 
 # TODO: add more test data
 @pytest.mark.parametrize("input,data", [
     (
-        b'\x81\xec\x04\x01\x00\x00\x0f\x80\xe6\x00\x03\x00\x80X\x02 \x00\x80\x86\x13\x05\x01\x06\x00\x02@\x00\x00'
-        b'dropzone\x00Einherjer Europe [linuxiuvat.de]\x00\x00',
+        QUERY_REPLY,
         {
             "description": "Einherjer Europe [linuxiuvat.de]",
             "map_name": "dropzone",
@@ -22,3 +27,73 @@ def test_parsed_query_reply(input, data: dict):
 
     for k, v in data.items():
         assert getattr(parsed, k) == v
+
+
+@pytest.mark.parametrize("input,expected_ints", [
+    (b"\x00\x7f\xff\x82", [0, 127, -1, -126]),
+    (b"\x80\xe6\x00\x80\x00\x80", [230, -32768]),
+    (b"\x81\x00\x00\x01\x00\x81\xff\xff\xff\xff", [65536, -1]),
+])
+def test_cube2_bytes_stream_ints(input, expected_ints):
+    stream = Cube2BytesStream(input, 0)
+    assert [stream.next_int() for _ in expected_ints] == expected_ints
+    assert stream.offset == len(input)
+
+
+def test_cube2_bytes_stream_strings():
+    stream = Cube2BytesStream(b"abc\x00\x00\x86\x96\x9c\x00", 0)
+    assert stream.next_string() == "abc"
+    assert stream.next_string() == ""
+    assert stream.next_string() == "äöü"
+
+
+@pytest.mark.parametrize("length", [0, 6, 14, 27, 36, len(QUERY_REPLY) - 2])
+def test_parsed_query_reply_truncated(length):
+    with pytest.raises(TruncatedQueryReplyError):
+        ParsedQueryReply(QUERY_REPLY[:length])
+
+
+def test_parsed_query_reply_lazy():
+    eager = ParsedQueryReply(QUERY_REPLY)
+    lazy = ParsedQueryReply(QUERY_REPLY, lazy=True)
+
+    assert lazy.description == eager.description
+
+    # a reply cut off after the description must be fine in lazy mode as long as the remaining fields aren't accessed
+    truncated = ParsedQueryReply(QUERY_REPLY[:-1], lazy=True)
+    assert truncated.description == eager.description
+
+    with pytest.raises(TruncatedQueryReplyError):
+        truncated.players
+
+    for name in ["map_name", "versionbuild", "versionbranch", "players", "accounts"]:
+        assert getattr(lazy, name) == getattr(eager, name)
+
+
+def test_parse_many():
+    eager = ParsedQueryReply(QUERY_REPLY)
+
+    parsed = parse_many([QUERY_REPLY, QUERY_REPLY[:20], QUERY_REPLY])
+
+    assert len(parsed) == 3
+    assert parsed.errors_count == 1
+
+    assert parsed.descriptions == [eager.description, None, eager.description]
+    assert list(parsed.players_count) == [eager.players_count, -1, eager.players_count]
+    assert list(parsed.max_slots) == [eager.max_slots, -1, eager.max_slots]
+    assert (parsed.version_major[0], parsed.version_minor[0], parsed.version_patch[0]) == eager.version
+
+    assert parsed.total_players == 2 * eager.players_count
+    assert parsed.mode_distribution() == {eager.game_mode: 2}
+
+
+@pytest.mark.parametrize("map_name", [b"", b"\x80zone", b"\x81zone"])
+def test_parse_many_map_names(map_name):
+    # the map name directly follows the ints, it must not be mistaken for one
+    reply = QUERY_REPLY.replace(b"dropzone", map_name)
+
+    parsed = parse_many([reply])
+
+    assert parsed.errors_count == 0
+    assert parsed.descriptions == [ParsedQueryReply(reply).description]
+    assert parsed.descriptions == ["Einherjer Europe [linuxiuvat.de]"]
@@ -0,0 +1,62 @@
+import pytest
+
+from masterserver import token_bucket
+from masterserver.rate_limiter import RateLimiter
+
+
+@pytest.fixture
+def clock(fake_clock):
+    return fake_clock(token_bucket)
+
+
+def test_per_ip_budgets(clock):
+    limiter = RateLimiter({"update": (1, 2), "server": (1, 1)})
+
+    assert limiter.try_acquire("update", "1.2.3.4")
+    assert limiter.try_acquire("update", "1.2.3.4")
+    assert not limiter.try_acquire("update", "1.2.3.4")
+
+    # other addresses and command classes have their own budgets
+    assert limiter.try_acquire("update", "1.2.4.4")
+    assert limiter.try_acquire("server", "1.2.3.4")
+
+    clock.now += 1
+    assert limiter.try_acquire("update", "1.2.3.4")
+
+    assert limiter.limited == {"update": 1, "server": 0, "auth": 0, "peer": 0}
+
+    with pytest.raises(KeyError):
+        limiter.try_acquire("unknown", "1.2.3.4")
+
+
+def test_per_subnet_budgets(clock):
+    limiter = RateLimiter({"server": (1, 1)}, subnet_factor=2)
+
+    assert limiter.try_acquire("server", "1.2.3.1")
+    assert limiter.try_acquire("server", "1.2.3.2")
+
+    # the subnet's budget is exhausted
+    assert not limiter.try_acquire("server", "1.2.3.3")
+
+    assert limiter.try_acquire("server", "1.2.4.1")
+    assert limiter.try_acquire("server", "2001:db8::1")
+
+
+def test_many_registrations_from_one_host(clock):
+    limiter = RateLimiter()
+
+    # all the game servers of a host register right after it has been started
+    assert all(limiter.try_acquire("server", "1.2.3.4") for _ in range(20))
+
+
+def test_table_is_bounded(clock):
+    limiter = RateLimiter({"server": (1, 1)}, max_entries=10)
+
+    for i in range(100):
+        limiter.try_acquire("server", "10.0.%d.1" % i)
+
+    assert len(limiter) == 10
+
+    # the least recently used buckets have been evicted, so the address gets a fresh budget
+    assert limiter.try_acquire("server", "10.0.0.1")
+    assert not limiter.try_acquire("server", "10.0.99.1")
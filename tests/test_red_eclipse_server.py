@@ -75,3 +75,44 @@ def test_attributes_writability():
     # now we cannot change the IP address any more
     with pytest.raises(ValueError):
         srv.ip_addr = IPv4Address("2.3.4.5")
+
+
+def test_cached_rendering():
+    srv = RedEclipseServer("123.4.5.6", 12345, 123, "abc", "", "", "stable")
+
+    assert srv.addserver_line() == '123.4.5.6 12345 123 "abc" "" "" "stable"'
+    assert srv.to_json_dict()["description"] == "abc"
+
+    # changes must invalidate the cached representations
+    srv.description = "def"
+    assert srv.addserver_line() == '123.4.5.6 12345 123 "def" "" "" "stable"'
+    assert srv.to_json_dict()["description"] == "def"
+
+    # modifying the returned dict must not affect the cache
+    srv.to_json_dict()["description"] = "ghi"
+    assert srv.to_json_dict()["description"] == "def"
+
+    srv = RedEclipseServer("192.168.2.1", 12345, 123, "", "", "", "stable")
+    old_hash = hash(srv)
+    assert srv.addserver_line() == '192.168.2.1 12345 123 "192.168.2.1:[12345]" "" "" "stable"'
+
+    srv.ip_addr = IPv4Address("1.2.3.4")
+    assert srv.addserver_line() == '1.2.3.4 12345 123 "1.2.3.4:[12345]" "" "" "stable"'
+    assert hash(srv) != old_hash
+    assert srv == RedEclipseServer("1.2.3.4", 12345)
+
+
+def test_slots():
+    srv = RedEclipseServer("123.4.5.6", 12345)
+
+    with pytest.raises(AttributeError):
+        srv.some_attribute = 1
+
+
+@pytest.mark.parametrize("port", [65536, 65537, -1])
+def test_invalid_port(port):
+    # 1.2.3.4:65537 would get the same key as 1.2.3.5:1
+    with pytest.raises(ValueError):
+        RedEclipseServer("1.2.3.4", port)
+
+    assert RedEclipseServer("1.2.3.4", 65535).key != RedEclipseServer("1.2.3.5", 0).key
@@ -4,6 +4,13 @@ import os
 import pytest
 
 from masterserver import MasterServer, setup_logging
+from masterserver.connection_limits import ConnectionLimits
+from masterserver.parsed_query_reply import ParsedQueryReply
+from masterserver.rate_limiter import RateLimiter
+from masterserver.red_eclipse_server import RedEclipseServer
+from masterserver.remote_master_server import RemoteMasterServer
+from masterserver.server_registry import ServerRegistry
+from masterserver.state_backup import StateBackup
 
 
 @pytest.fixture(scope="session", autouse=True)
@@ -69,3 +76,451 @@ async def test_update_command_empty_server(masterserver):
 
     finally:
         await masterserver.stop_server()
+
+
+class FakeGameServerProtocol(asyncio.DatagramProtocol):
+    # see test_query_reply_parser.py
+    REPLY = (
+        b'\x81\xec\x04\x01\x00\x00\x0f\x80\xe6\x00\x03\x00\x80X\x02 \x00\x80\x86\x13\x05\x01\x06\x00\x02@\x00\x00'
+        b'dropzone\x00Einherjer Europe [linuxiuvat.de]\x00\x00'
+    )
+
+    def __init__(self):
+        self.requests_count = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.requests_count += 1
+
+        # reply a bit later to make sure the pings overlap
+        asyncio.get_event_loop().call_later(0.1, self.transport.sendto, self.REPLY, addr)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_registrations_share_ping(masterserver, unused_udp_port):
+    transport, protocol = await asyncio.get_event_loop().create_datagram_endpoint(
+        FakeGameServerProtocol, local_addr=("127.0.0.1", unused_udp_port)
+    )
+
+    await masterserver.start_server()
+
+    try:
+        results = await asyncio.gather(*[
+            masterserver.register_server("127.0.0.1", "*", unused_udp_port - 1, "stable") for _ in range(5)
+        ])
+
+        assert all(result is not None for result in results)
+        assert protocol.requests_count == 1
+        assert len(masterserver.servers) == 1
+        assert list(masterserver.servers)[0].description == "Einherjer Europe [linuxiuvat.de]"
+
+    finally:
+        await masterserver.stop_server()
+        transport.close()
+
+
+@pytest.mark.asyncio
+async def test_restore_backup(tmp_path, unused_tcp_port, unused_udp_port_factory):
+    alive_port, dead_port = unused_udp_port_factory(), unused_udp_port_factory()
+
+    transport, protocol = await asyncio.get_event_loop().create_datagram_endpoint(
+        FakeGameServerProtocol, local_addr=("127.0.0.1", alive_port)
+    )
+
+    backup_file = tmp_path / "backup.txt"
+    backup_file.write_text("127.0.0.1:%d\n127.0.0.1:%d\n" % (alive_port - 1, dead_port - 1))
+
+    masterserver = MasterServer(port=unused_tcp_port, backup_file=str(backup_file))
+    await masterserver.start_server()
+
+    try:
+        # only the server which replied to the ping must be listed
+        assert [(server.port, server.verified) for server in masterserver.servers] == [(alive_port - 1, True)]
+
+    finally:
+        await masterserver.stop_server()
+        transport.close()
+
+
+@pytest.mark.asyncio
+async def test_restore_recent_backup_unverified(tmp_path, unused_tcp_port):
+    backup_file = tmp_path / "backup.txt"
+    backup_file.write_text("127.0.0.1:12345\n")
+
+    masterserver = MasterServer(port=unused_tcp_port, backup_file=str(backup_file), serve_backup_max_age=60)
+    await masterserver.start_server()
+
+    try:
+        # the entries must be listed right away, before they have been pinged
+        assert [(server.port, server.verified) for server in masterserver.servers] == [(12345, False)]
+
+    finally:
+        await masterserver.stop_server()
+
+
+@pytest.mark.asyncio
+async def test_restore_full_backup(tmp_path, unused_tcp_port):
+    backup_file = str(tmp_path / "backup.bin")
+
+    registry = ServerRegistry()
+    registry.upsert(RedEclipseServer("127.0.0.1", 12345, 0, "own server", "", "", "stable"))
+    registry.upsert(RedEclipseServer("127.0.0.1", 23456, 0, "proxied server", "", "", "stable",
+                                     RemoteMasterServer("127.0.0.2", 28800)))
+    await StateBackup(backup_file).save(registry.snapshot)
+
+    masterserver = MasterServer(port=unused_tcp_port, backup_file=backup_file, serve_backup_max_age=60)
+    await masterserver.start_server()
+
+    try:
+        # complete entries must be listed right away, entries of master servers which aren't proxied any more dropped
+        assert [server.description for server in masterserver.servers] == ["own server"]
+
+    finally:
+        await masterserver.stop_server()
+
+
+@pytest.mark.asyncio
+async def test_merge_remote_list(masterserver, unused_udp_port_factory):
+    alive_port, dead_port = unused_udp_port_factory(), unused_udp_port_factory()
+
+    transport, protocol = await asyncio.get_event_loop().create_datagram_endpoint(
+        FakeGameServerProtocol, local_addr=("127.0.0.1", alive_port)
+    )
+
+    remote = RemoteMasterServer("127.0.0.2", 28800)
+
+    await masterserver.start_server()
+
+    try:
+        await masterserver.merge_remote_list(remote, [
+            RedEclipseServer("127.0.0.1", alive_port - 1, 0, "alive", "", "", "stable", remote),
+            RedEclipseServer("127.0.0.1", dead_port - 1, 0, "dead", "", "", "stable", remote),
+        ])
+
+        # only the server which replied to the ping must be listed, with the description it sent
+        assert [(server.port, server.description) for server in masterserver.servers] == [
+            (alive_port - 1, "Einherjer Europe [linuxiuvat.de]")
+        ]
+
+        # entries which the remote master server doesn't list any more are removed
+        await masterserver.merge_remote_list(remote, [])
+        assert len(masterserver.servers) == 0
+
+    finally:
+        await masterserver.stop_server()
+        transport.close()
+
+
+@pytest.mark.asyncio
+async def test_merge_trusted_remote_list(masterserver, unused_udp_port):
+    masterserver.add_server_to_proxy("127.0.0.2", 28800, trusted=True)
+    remote = masterserver.proxied_master_servers[0].remote_master_server
+
+    await masterserver.start_server()
+
+    try:
+        # nothing replies on this port, but entries of trusted master servers are listed without pinging them
+        server = RedEclipseServer("127.0.0.1", unused_udp_port - 1, 0, "trusted", "", "", "stable", remote)
+        await masterserver.merge_remote_list(remote, [server])
+
+        assert list(masterserver.servers) == [server]
+
+        # failed pings don't remove the entries, only the master server can remove them
+        await masterserver._ping_and_update_servers([server])
+        assert list(masterserver.servers) == [server]
+
+        await masterserver.merge_remote_list(remote, [])
+        assert len(masterserver.servers) == 0
+
+    finally:
+        await masterserver.stop_server()
+
+
+async def wait_for_condition(condition, timeout: float = 5):
+    deadline = asyncio.get_event_loop().time() + timeout
+
+    while not condition():
+        assert asyncio.get_event_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.05)
+
+
+@pytest.mark.asyncio
+async def test_peer_sync(unused_tcp_port_factory, unused_udp_port):
+    transport, protocol = await asyncio.get_event_loop().create_datagram_endpoint(
+        FakeGameServerProtocol, local_addr=("127.0.0.1", unused_udp_port)
+    )
+
+    node1 = MasterServer(port=unused_tcp_port_factory())
+    node2 = MasterServer(port=unused_tcp_port_factory())
+    node2.add_peer("127.0.0.1", node1.port)
+
+    await node1.start_server()
+    await node2.start_server()
+
+    try:
+        server = await node1.register_server("127.0.0.1", "*", unused_udp_port - 1, "stable")
+        assert server is not None
+
+        # the registration must be sent to the peer right away
+        await wait_for_condition(lambda: server in node2.servers)
+
+        peer_entry = list(node2.servers)[0]
+        assert peer_entry.description == "Einherjer Europe [linuxiuvat.de]"
+        assert peer_entry.remote_master_server == node2.peers[0]
+
+        # removing and adding a server again results in a single delta, which must be applied in order
+        node1._servers.remove(server)
+        node1._servers.upsert(server)
+
+        await wait_for_condition(lambda: node2.peers[0].seq == node1._servers.change_log.seq)
+        assert server in node2.servers
+
+        await node1.remove_server(server)
+        await wait_for_condition(lambda: len(node2.servers) == 0)
+
+    finally:
+        await node2.stop_server()
+        await node1.stop_server()
+        transport.close()
+
+
+@pytest.mark.asyncio
+async def test_peer_sync_response(masterserver):
+    server = RedEclipseServer("127.0.0.1", 12345, 0, "own", "", "", "stable")
+    masterserver._servers.upsert(server)
+    masterserver._servers.upsert(RedEclipseServer("127.0.0.2", 12345, 0, "own2", "", "", "stable"))
+    masterserver._servers.remove(server)
+
+    epoch = masterserver._servers.change_log.epoch
+
+    # peers which haven't synced yet get the complete list
+    assert await masterserver.peer_sync_response("-", 0) == (
+        'peerreset %s 3\naddserver 127.0.0.2 12345 0 "own2" "" "" "stable"\npeerend\n' % epoch
+    ).encode()
+
+    # the complete list is rendered only once per change
+    assert await masterserver.peer_sync_response("-", 0) is await masterserver.peer_sync_response("-", 0)
+
+    # others get the changes since their last sync
+    assert await masterserver.peer_sync_response(epoch, 1) == (
+        'peerdelta %s 3\n'
+        'addserver 127.0.0.2 12345 0 "own2" "" "" "stable"\n'
+        'delserver 127.0.0.1 12345\n'
+        'peerend\n' % epoch
+    ).encode()
+
+
+@pytest.mark.asyncio
+async def test_connection_limits(unused_tcp_port):
+    limits = ConnectionLimits(max_connections=1, read_timeout=0.2, write_buffer_size=4)
+    masterserver = MasterServer(port=unused_tcp_port, connection_limits=limits)
+
+    await masterserver.start_server()
+
+    try:
+        reader1, writer1 = await asyncio.open_connection("127.0.0.1", masterserver.port)
+        await wait_for_condition(lambda: limits.active == 1)
+
+        # the second connection exceeds the cap
+        reader2, writer2 = await asyncio.open_connection("127.0.0.1", masterserver.port)
+        assert await asyncio.wait_for(reader2.read(), timeout=5.0) == b'error "Too many connections"\n'
+        assert limits.rejected == 1
+        writer2.close()
+
+        # the first one doesn't send a command in time
+        assert await asyncio.wait_for(reader1.read(), timeout=5.0) == b""
+        assert limits.timed_out == 1
+        writer1.close()
+
+        await wait_for_condition(lambda: limits.active == 0)
+
+        # responses larger than the write buffer are written in chunks
+        reader, writer = await asyncio.open_connection("127.0.0.1", masterserver.port)
+        writer.write(b"update\n")
+        assert await asyncio.wait_for(reader.read(), timeout=5.0) == b'setversion 160 230\nclearservers\n'
+        writer.close()
+
+    finally:
+        await masterserver.stop_server()
+
+
+@pytest.mark.asyncio
+async def test_rate_limit(unused_tcp_port):
+    masterserver = MasterServer(port=unused_tcp_port, rate_limiter=RateLimiter({"update": (0.01, 1)}))
+
+    await masterserver.start_server()
+
+    async def update():
+        reader, writer = await asyncio.open_connection("127.0.0.1", masterserver.port)
+        writer.write(b"update\n")
+
+        try:
+            return await asyncio.wait_for(reader.read(), timeout=5.0)
+        finally:
+            writer.close()
+
+    try:
+        assert await update() == b'setversion 160 230\nclearservers\n'
+        assert await update() == b'error "Rate limit exceeded: update"\n'
+
+    finally:
+        await masterserver.stop_server()
+
+
+@pytest.mark.asyncio
+async def test_negative_cache(masterserver, unused_udp_port):
+    await masterserver.start_server()
+
+    try:
+        # nothing replies on this port
+        assert await masterserver.register_server("127.0.0.1", "*", unused_udp_port - 1, "stable") is None
+
+        # the server must not be pinged again right away
+        probes_sent = masterserver._ping_service.probes_sent
+        assert await masterserver.register_server("127.0.0.1", "*", unused_udp_port - 1, "stable") is None
+
+        assert masterserver._ping_service.probes_sent == probes_sent
+        assert masterserver._negative_cache.pings_avoided == 1
+
+    finally:
+        await masterserver.stop_server()
+
+
+@pytest.mark.asyncio
+async def test_reregistration_keeps_description(masterserver, unused_udp_port):
+    transport, protocol = await asyncio.get_event_loop().create_datagram_endpoint(
+        FakeGameServerProtocol, local_addr=("127.0.0.1", unused_udp_port)
+    )
+
+    await masterserver.start_server()
+
+    try:
+        await masterserver.register_server("127.0.0.1", "*", unused_udp_port - 1, "stable")
+        server = await masterserver.register_server("127.0.0.1", "*", unused_udp_port - 1, "stable")
+
+        # the description sent by the server must not be replaced by the placeholder until the next ping
+        assert [s.description for s in masterserver.servers] == ["Einherjer Europe [linuxiuvat.de]"]
+        assert list(masterserver.servers)[0] is server
+
+    finally:
+        await masterserver.stop_server()
+        transport.close()
+
+
+@pytest.mark.asyncio
+async def test_unreachable_peer_entries_removed(masterserver, unused_tcp_port_factory):
+    # nothing listens on the peer's port
+    masterserver.add_peer("127.0.0.1", unused_tcp_port_factory())
+    peer = masterserver.peers[0]
+
+    server = RedEclipseServer("127.0.0.1", 12345, 0, "peer", "", "", "stable", peer)
+    masterserver._servers.upsert(server)
+
+    # the entries are kept until the circuit breaker gives up on the peer
+    await masterserver._sync_with_peer(peer)
+    assert len(masterserver.servers) == 1
+
+    await masterserver._sync_with_peer(peer)
+    await masterserver._sync_with_peer(peer)
+
+    assert peer.circuit_breaker.is_open
+    assert len(masterserver.servers) == 0
+
+
+@pytest.mark.asyncio
+async def test_peersync_rate_limit(unused_tcp_port):
+    masterserver = MasterServer(port=unused_tcp_port, rate_limiter=RateLimiter({"peer": (0.01, 1)}))
+
+    await masterserver.start_server()
+
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", masterserver.port)
+
+        try:
+            writer.write(b"peersync - 0\npeersync - 0\n")
+
+            response = await asyncio.wait_for(reader.read(), timeout=5.0)
+            assert response.endswith(b'peerend\nerror "Rate limit exceeded: peersync - 0"\n')
+
+        finally:
+            writer.close()
+
+    finally:
+        await masterserver.stop_server()
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_keeps_registered_server(unused_tcp_port, unused_udp_port):
+    transport, protocol = await asyncio.get_event_loop().create_datagram_endpoint(
+        FakeGameServerProtocol, local_addr=("127.0.0.1", unused_udp_port)
+    )
+
+    masterserver = MasterServer(port=unused_tcp_port, rate_limiter=RateLimiter({"auth": (0.01, 1)}))
+
+    await masterserver.start_server()
+
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", masterserver.port)
+
+        try:
+            writer.write('server {} * 230 "" 0 "stable"\n'.format(unused_udp_port - 1).encode())
+            assert (await asyncio.wait_for(reader.readline(), timeout=5.0)).startswith(b'echo "Successfully pinged')
+
+            writer.write(b"reqauth 1 nobody 127.0.0.1\nreqauth 2 nobody 127.0.0.1\n")
+            assert await asyncio.wait_for(reader.readline(), timeout=5.0) == b"failauth 1\n"
+
+            # the second request is rejected, but the server must stay listed
+            assert await asyncio.wait_for(reader.readline(), timeout=5.0) == b"failauth 2\n"
+            assert len(masterserver.servers) == 1
+
+        finally:
+            writer.close()
+
+        await wait_for_condition(lambda: len(masterserver.servers) == 0)
+
+    finally:
+        await masterserver.stop_server()
+        transport.close()
+
+
+@pytest.mark.asyncio
+async def test_register_invalid_query_port(masterserver, unused_udp_port):
+    transport, protocol = await asyncio.get_event_loop().create_datagram_endpoint(
+        FakeGameServerProtocol, local_addr=("127.0.0.1", unused_udp_port)
+    )
+
+    await masterserver.start_server()
+
+    try:
+        # the query port would be 65536
+        assert await masterserver.register_server("127.0.0.1", "*", 65535, "stable") is None
+
+        # other servers must still be pinged
+        assert await masterserver.register_server("127.0.0.1", "*", unused_udp_port - 1, "stable") is not None
+
+    finally:
+        await masterserver.stop_server()
+        transport.close()
+
+
+@pytest.mark.asyncio
+async def test_ping_statistics(masterserver, unused_udp_port):
+    transport, protocol = await asyncio.get_event_loop().create_datagram_endpoint(
+        FakeGameServerProtocol, local_addr=("127.0.0.1", unused_udp_port)
+    )
+
+    await masterserver.start_server()
+
+    try:
+        server = RedEclipseServer("127.0.0.1", unused_udp_port - 1)
+        await masterserver._ping_and_update_servers([server])
+
+        parsed = ParsedQueryReply(FakeGameServerProtocol.REPLY)
+        assert masterserver._ping_stats_players == parsed.players_count
+        assert masterserver._ping_stats_modes == {parsed.game_mode: 1}
+
+    finally:
+        await masterserver.stop_server()
+        transport.close()
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from masterserver.remote_master_server import RemoteMasterServer
+from masterserver.server_list_parser import ServerListParser
+
+
+def test_parse_line():
+    remote = RemoteMasterServer("1.2.3.4", 28800)
+    parser = ServerListParser(remote)
+
+    server = parser.parse_line(b'addserver 123.4.5.6 28801 -1 "Test \xe9 \x10" "handle" "" "stable"\r\n')
+
+    assert server.ip_addr.exploded == "123.4.5.6"
+    assert server.port == 28801
+    assert server.priority == -1
+    assert server.description == "Test з Ê"
+    assert server.auth_handle == "handle"
+    assert server.role == ""
+    assert server.branch == "stable"
+    assert server.remote_master_server is remote
+
+
+def test_parse_other_lines():
+    parser = ServerListParser(None)
+
+    assert parser.parse_line(b"setversion 160 230\n") is None
+    assert parser.parse_line(b"clearservers\n") is None
+
+
+@pytest.mark.parametrize("line", [
+    b'addserver 123.4.5.6 28801 0 "" "" "" ""\n',
+    b'addserver 123.4.5.6 28801 0 "desc" "" ""\n',
+    b'addserver 123.4.5.6 28801 0 "desc" "" "" "" trailing\n',
+    b'addserver 123.4.5.6 28801 0 "desc"  "" "" ""\n',
+    b'addserver 123.4.5.6 28801 "desc" "" "" ""\n',
+    b'addserver 123.4.5.6 port 0 "desc" "" "" ""\n',
+    b'addserver 123.4.5 28801 0 "desc" "" "" ""\n',
+    b'addserver 123.4.5.6 65537 0 "desc" "" "" ""\n',
+    b'addserver 123.4.5.6 -1 0 "desc" "" "" ""\n',
+])
+def test_parse_invalid_line(line):
+    with pytest.raises(ValueError):
+        ServerListParser(None).parse_line(line)
+
+
+@pytest.mark.asyncio
+async def test_iter_servers(unused_tcp_port):
+    # the first server must be yielded before the list is complete
+    first_received = asyncio.Event()
+
+    async def handle_client(reader, writer):
+        await reader.readline()
+
+        writer.write(b'setversion 160 230\nclearservers\naddserver 1.2.3.4 28801 0 "a" "" "" "stable"\n')
+        await writer.drain()
+
+        await first_received.wait()
+
+        writer.write(b'addserver 1.2.3.5 28801 0 "b" "" "" "stable"\ninvalid\n')
+        await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle_client, "127.0.0.1", unused_tcp_port)
+
+    try:
+        descriptions = []
+
+        async for parsed in RemoteMasterServer("127.0.0.1", unused_tcp_port).iter_servers(read_timeout=5):
+            descriptions.append(parsed.description)
+            first_received.set()
+
+        assert descriptions == ["a", "b"]
+
+    finally:
+        server.close()
+        await server.wait_closed()
@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+from masterserver.server_pinger import PingService, PingError
+
+
+class FakeServerProtocol(asyncio.DatagramProtocol):
+    def __init__(self, reply: bytes):
+        self.reply = reply
+        self.requests_count = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.requests_count += 1
+
+        if self.reply is not None:
+            self.transport.sendto(data + self.reply, addr)
+
+
+async def start_fake_server(port: int, reply: bytes = None):
+    loop = asyncio.get_event_loop()
+    return await loop.create_datagram_endpoint(lambda: FakeServerProtocol(reply), local_addr=("127.0.0.1", port))
+
+
+@pytest.mark.asyncio
+async def test_ping_service(unused_udp_port_factory):
+    ports = [unused_udp_port_factory() for _ in range(3)]
+    servers = [await start_fake_server(port, b"port %d" % port) for port in ports]
+
+    ping_service = PingService()
+    await ping_service.start()
+
+    try:
+        results = await asyncio.gather(*[ping_service.ping("127.0.0.1", port) for port in ports * 2])
+        replies = [result.data for result in results]
+
+        assert replies == [b"\x81\xec\x04\x01\x00port %d" % port for port in ports * 2]
+        assert all(result.attempts == 1 and result.rtt is not None for result in results)
+
+    finally:
+        ping_service.stop()
+
+        for transport, _ in servers:
+            transport.close()
+
+
+@pytest.mark.asyncio
+async def test_ping_service_timeout(unused_udp_port):
+    transport, protocol = await start_fake_server(unused_udp_port)
+
+    ping_service = PingService()
+    await ping_service.start()
+
+    try:
+        with pytest.raises(TimeoutError):
+            await ping_service.ping("127.0.0.1", unused_udp_port, timeout=0.1, attempts=3)
+
+        assert protocol.requests_count == 3
+
+    finally:
+        ping_service.stop()
+        transport.close()
+
+
+@pytest.mark.asyncio
+async def test_ping_service_not_running():
+    with pytest.raises(PingError):
+        await PingService().ping("127.0.0.1", 12345)
+
+
+@pytest.mark.asyncio
+async def test_ping_service_invalid_port(unused_udp_port):
+    transport, protocol = await start_fake_server(unused_udp_port, b"reply")
+
+    ping_service = PingService()
+    await ping_service.start()
+
+    try:
+        with pytest.raises(PingError):
+            await ping_service.ping("127.0.0.1", 65536)
+
+        # the shared socket must still work
+        assert (await ping_service.ping("127.0.0.1", unused_udp_port)).data.endswith(b"reply")
+
+    finally:
+        ping_service.stop()
+        transport.close()
+
+
+@pytest.mark.asyncio
+async def test_ping_service_reopens_closed_socket(unused_udp_port):
+    transport, protocol = await start_fake_server(unused_udp_port, b"reply")
+
+    ping_service = PingService()
+    await ping_service.start()
+
+    try:
+        ping_service._transports[0].close()
+
+        assert (await ping_service.ping("127.0.0.1", unused_udp_port)).data.endswith(b"reply")
+        assert not ping_service._transports[0].is_closing()
+
+    finally:
+        ping_service.stop()
+        transport.close()
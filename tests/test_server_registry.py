@@ -0,0 +1,159 @@
+from masterserver.red_eclipse_server import RedEclipseServer
+from masterserver.remote_master_server import RemoteMasterServer
+from masterserver.server_registry import ServerRegistry
+
+
+def test_upsert_and_remove():
+    registry = ServerRegistry()
+
+    srv1 = RedEclipseServer("123.4.5.6", 12345, 123, "", "", "", "stable")
+    srv2 = RedEclipseServer("123.4.5.7", 12345, 123, "", "", "", "stable")
+
+    assert registry.upsert(srv1) is None
+    assert registry.upsert(srv2) is None
+    assert len(registry) == 2
+
+    # equal servers replace the stored instance
+    srv3 = RedEclipseServer("123.4.5.6", 12345, 456, "", "", "", "master")
+    assert registry.upsert(srv3) is srv1
+    assert len(registry) == 2
+    assert registry.get(srv1) is srv3
+    assert srv1 in registry
+
+    assert registry.by_branch("stable") == (srv2,)
+    assert registry.by_branch("master") == (srv3,)
+
+    assert registry.remove(srv1) is srv3
+    assert srv1 not in registry
+    assert registry.get(srv1) is None
+    assert registry.by_branch("master") == ()
+    assert list(registry) == [srv2]
+
+
+def test_origin_indexes():
+    registry = ServerRegistry()
+
+    # instances are created anew for every poll, therefore they must compare equal
+    remote1, remote2 = RemoteMasterServer("master1.example.com"), RemoteMasterServer("master2.example.com")
+
+    own = RedEclipseServer("1.2.3.4", 28801, 0, "", "", "", "")
+    proxied1 = RedEclipseServer("1.2.3.5", 28801, remote_master_server=remote1)
+    proxied2 = RedEclipseServer("1.2.3.6", 28801, remote_master_server=remote2)
+
+    for server in [own, proxied1, proxied2]:
+        registry.upsert(server)
+
+    assert registry.own() == (own,)
+    assert set(registry.proxied()) == {proxied1, proxied2}
+    assert registry.by_remote(RemoteMasterServer("master1.example.com")) == (proxied1,)
+
+    # servers can move from a remote to our own list
+    registry.upsert(RedEclipseServer("1.2.3.5", 28801))
+    assert registry.by_remote(remote1) == ()
+    assert len(registry.own()) == 2
+
+
+def test_generation():
+    registry = ServerRegistry()
+
+    srv = RedEclipseServer("123.4.5.6", 12345, 123, "abc", "", "", "stable")
+
+    registry.upsert(srv)
+    generation = registry.generation
+
+    # replacing a server with an identical one must not invalidate anything
+    registry.upsert(RedEclipseServer("123.4.5.6", 12345, 123, "abc", "", "", "stable"))
+    assert registry.generation == generation
+
+    srv = RedEclipseServer("123.4.5.6", 12345, 123, "def", "", "", "stable")
+    registry.upsert(srv)
+    assert registry.generation == generation + 1
+
+    registry.set_description(srv, "def")
+    assert registry.generation == generation + 1
+
+    registry.set_description(srv, "ghi")
+    assert registry.generation == generation + 2
+
+    registry.remove(srv)
+    assert registry.generation == generation + 3
+
+
+def test_snapshots():
+    registry = ServerRegistry()
+
+    srv1 = RedEclipseServer("123.4.5.6", 12345, 123, "abc", "", "", "stable")
+    srv2 = RedEclipseServer("123.4.5.7", 12345, 123, "def", "", "", "stable")
+
+    registry.upsert(srv1)
+
+    snapshot = registry.snapshot
+    assert list(snapshot) == [srv1]
+
+    # snapshots are reused until the registry changes
+    assert registry.snapshot is snapshot
+
+    registry.upsert(srv2)
+
+    # existing snapshots are not affected by changes
+    assert list(snapshot) == [srv1]
+    assert srv2 not in snapshot
+
+    new_snapshot = registry.snapshot
+    assert new_snapshot is not snapshot
+    assert new_snapshot.generation == registry.generation
+    assert len(new_snapshot) == 2
+    assert srv2 in new_snapshot
+
+    assert new_snapshot.update_response() == (
+        'setversion 160 230\nclearservers\n'
+        'addserver 123.4.5.6 12345 123 "abc" "" "" "stable"\n'
+        'addserver 123.4.5.7 12345 123 "def" "" "" "stable"\n'
+    ).encode("cube2")
+
+
+def test_merge_remote_list():
+    remote1 = RemoteMasterServer("1.2.3.4", 28800)
+    remote2 = RemoteMasterServer("1.2.3.5", 28800)
+
+    registry = ServerRegistry()
+
+    own = RedEclipseServer("123.4.5.6", 12345, 0, "own", "", "", "stable")
+    registry.upsert(own)
+
+    other = RedEclipseServer("123.4.5.7", 12345, 0, "other", "", "", "stable", remote2)
+    registry.upsert(other)
+
+    listed = RedEclipseServer("123.4.5.8", 12345, 0, "listed", "", "", "stable", remote1)
+    listed.ping_history.record_success(0.1)
+    registry.upsert(listed)
+
+    vanished = RedEclipseServer("123.4.5.9", 12345, 0, "vanished", "", "", "stable", remote1)
+    registry.upsert(vanished)
+
+    new = RedEclipseServer("123.4.5.10", 12345, 0, "new", "", "", "stable", remote1)
+    updated = RedEclipseServer("123.4.5.8", 12345, 0, "updated", "", "", "stable", remote1)
+
+    result = registry.merge_remote_list(remote1, [
+        RedEclipseServer("123.4.5.6", 12345, 0, "own?", "", "", "stable", remote1),
+        RedEclipseServer("123.4.5.7", 12345, 0, "other?", "", "", "stable", remote1),
+        updated,
+        new,
+        RedEclipseServer("123.4.5.10", 12345, 0, "duplicate", "", "", "stable", remote1),
+    ])
+
+    assert result.new == [new]
+    assert result.updated == [updated]
+    assert result.removed == [vanished]
+
+    # own registrations and entries of other master servers take precedence
+    assert registry.get(own) is own
+    assert registry.get(other) is other
+
+    assert registry.get(updated) is updated
+    assert updated.ping_history is listed.ping_history
+
+    # new servers are not added before they've been verified
+    assert new not in registry
+    assert vanished not in registry
+    assert registry.by_remote(remote1) == (updated,)
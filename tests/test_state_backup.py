@@ -0,0 +1,145 @@
+import os
+import struct
+import time
+
+import pytest
+
+from masterserver.red_eclipse_server import RedEclipseServer
+from masterserver.remote_master_server import RemoteMasterServer
+from masterserver.server_registry import ServerRegistry
+from masterserver.state_backup import BackupFormatError, StateBackup
+
+
+@pytest.mark.asyncio
+async def test_save(tmp_path):
+    path = str(tmp_path / "backup.txt")
+
+    registry = ServerRegistry()
+    registry.upsert(RedEclipseServer("123.4.5.6", 12345, 123, "abc", "", "", "stable"))
+
+    backup = StateBackup(path)
+
+    assert await backup.save(registry.snapshot)
+    assert backup.last_bytes_written == os.path.getsize(path)
+    assert backup.last_duration >= 0
+
+    # unchanged snapshots are not written again
+    assert not await backup.save(registry.snapshot)
+
+    registry.upsert(RedEclipseServer("123.4.5.7", 12345, 123, "def", "", "", "stable"))
+    assert await backup.save(registry.snapshot)
+
+    servers, _ = backup.load()
+    assert [server.addserver_line() for server in servers] == [
+        '123.4.5.6 12345 123 "abc" "" "" "stable"',
+        '123.4.5.7 12345 123 "def" "" "" "stable"',
+    ]
+
+    # the temporary file must have been moved in place
+    assert os.listdir(str(tmp_path)) == ["backup.txt"]
+
+
+@pytest.mark.asyncio
+async def test_round_trip(tmp_path):
+    path = str(tmp_path / "backup.bin")
+
+    remote = RemoteMasterServer("play.redeclipse.net", 28800)
+
+    pinged = RedEclipseServer("123.4.5.6", 12345, 1, "abc", "handle", "r", "stable")
+    pinged.ping_history.record_success(0.05, 1, b"\x01\x02\x03")
+
+    proxied = RedEclipseServer("123.4.5.7", 23456, 0, "d\u00e9f", None, None, "master", remote)
+
+    registry = ServerRegistry()
+    registry.upsert(pinged)
+    registry.upsert(proxied)
+
+    backup = StateBackup(path)
+    await backup.save(registry.snapshot)
+
+    started = time.time()
+    servers, written = backup.load()
+    assert started - 5 < written <= started
+
+    assert [server.to_json_dict() for server in servers] == [pinged.to_json_dict(), proxied.to_json_dict()]
+    assert servers[1].remote_master_server == remote
+
+    history = servers[0].ping_history
+    assert history.srtt == pytest.approx(0.05)
+    assert history.last_success == pinged.ping_history.last_success
+    assert history.last_reply == b"\x01\x02\x03"
+
+    assert servers[1].ping_history.last_success is None
+
+    # backing up must not create ping histories for entries which have never been pinged
+    assert proxied.existing_ping_history is None
+
+
+@pytest.mark.asyncio
+async def test_skip_invalid_record(tmp_path):
+    path = str(tmp_path / "backup.bin")
+
+    valid = RedEclipseServer("123.4.5.6", 12345, 1, "abc", "", "", "stable")
+
+    registry = ServerRegistry()
+    registry.upsert(valid)
+    # the priority doesn't fit into the record
+    registry.upsert(RedEclipseServer("123.4.5.7", 12345, 2 ** 31, "def", "", "", "stable"))
+
+    backup = StateBackup(path)
+    assert await backup.save(registry.snapshot)
+    assert backup.last_generation == registry.snapshot.generation
+
+    servers, _ = backup.load()
+    assert [server.to_json_dict() for server in servers] == [valid.to_json_dict()]
+
+
+@pytest.mark.asyncio
+async def test_unchanged_backup_stays_current(tmp_path):
+    path = str(tmp_path / "backup.bin")
+
+    registry = ServerRegistry()
+    registry.upsert(RedEclipseServer("123.4.5.6", 12345, 123, "abc", "", "", "stable"))
+
+    backup = StateBackup(path)
+    await backup.save(registry.snapshot)
+
+    # pretend the backup has been written a while ago
+    os.utime(path, (0, 0))
+    with open(path, "r+b") as f:
+        f.seek(6)
+        f.write(struct.pack("<d", 0))
+
+    # the list hasn't changed, so the backup isn't written again, but it's still current
+    assert not await backup.save(registry.snapshot)
+
+    _, written = backup.load()
+    assert written > time.time() - 5
+
+
+def test_load_legacy(tmp_path):
+    path = tmp_path / "backup.txt"
+    path.write_text("123.4.5.6:12345\n\n123.4.5.7:23456\n")
+
+    servers, written = StateBackup(str(path)).load()
+    assert [(server.ip_addr.exploded, server.port) for server in servers] == [
+        ("123.4.5.6", 12345), ("123.4.5.7", 23456)
+    ]
+    assert written == os.path.getmtime(str(path))
+
+
+@pytest.mark.asyncio
+async def test_load_truncated(tmp_path):
+    path = str(tmp_path / "backup.bin")
+
+    registry = ServerRegistry()
+    registry.upsert(RedEclipseServer("123.4.5.6", 12345, 123, "abc", "", "", "stable"))
+
+    backup = StateBackup(path)
+    await backup.save(registry.snapshot)
+
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 3)
+
+    with pytest.raises(BackupFormatError):
+        backup.load()